@@ -11,6 +11,7 @@ class Settings(BaseSettings):
     # ===== DashScope =====
     dashscope_api_key: str = ""
     dashscope_base_url: str = "https://dashscope.aliyuncs.com/api/v1"
+    dashscope_http_stream: bool = True  # 流式调用直接走 HTTP SSE；False 时使用 SDK（线程）实现
     
     # ===== 模型配置 =====
     # A：中控（Qwen）
@@ -45,6 +46,7 @@ class Settings(BaseSettings):
     jwt_secret: str = "dev-secret-change-in-production"
     jwt_algorithm: str = "HS256"
     jwt_expire_hours: int = 24
+    bcrypt_rounds: int = 12  # 密码哈希成本因子（每 +1 耗时翻倍）
     
     # ===== 服务配置 =====
     backend_host: str = "0.0.0.0"
@@ -53,6 +55,11 @@ class Settings(BaseSettings):
     
     # ===== 工作流 =====
     max_retries: int = 3
+
+    # ===== 批量调用（多个独立条目合并到一次模型调用）=====
+    model_batch_size: int = 8                 # 每次调用最多合并的条目数
+    model_batch_max_item_chars: int = 4000    # 单条目超过该长度（约 2K token）不合并，逐条调用
+    model_coalesce_inflight: bool = False     # 参数完全相同的确定性（temperature=0 / seed）并发请求合并为一次调用
     
     # ===== 渲染配置 =====
     render_width_px: int = 1200
@@ -11,6 +11,7 @@ from pathlib import Path
 
 from app.config import settings
 from app.database import init_db
+from app.services.model_client import model_client
 from app.routers import auth, documents, workflow, attachments, export, users
 
 
@@ -27,7 +28,8 @@ async def lifespan(app: FastAPI):
     
     yield
     
-    # 关闭时（如果需要清理）
+    # 关闭时：释放模型客户端的 HTTP 连接池
+    await model_client.aclose()
 
 
 # 创建应用
@@ -12,6 +12,7 @@ from typing import Dict, Any, List
 
 from app.services.model_client import model_client
 from app.config import settings
+from app.utils.jsonparse import loads_json
 
 ATTACHMENT_ANALYSIS_PROMPT = """请分析用户上传的文件/图片，提取可用于文档撰写的信息。
 
@@ -209,7 +210,7 @@ def _parse_analysis_response(response: str) -> Dict[str, Any]:
         else:
             json_str = response
         
-        return json.loads(json_str.strip())
+        return loads_json(json_str.strip())
         
     except (json.JSONDecodeError, IndexError):
         return {
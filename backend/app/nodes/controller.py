@@ -286,6 +286,7 @@ async def run_streaming_generator(state: Any) -> AsyncGenerator[Dict[str, Any],
             search_options={"search_strategy": settings.model_controller_search_strategy},
             max_tokens=8192,
             tools=CONTROLLER_TOOLS, # 启用工具调用
+            **(s.get("stream_options") or {}),  # 推送粒度（min_flush_bytes / max_flush_interval_ms）
         ):
             if event["type"] == "thinking":
                 full_reasoning += event["content"]
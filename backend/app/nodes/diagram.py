@@ -12,6 +12,7 @@ from typing import Dict, Any, List
 
 from app.services.model_client import model_client
 from app.config import settings
+from app.utils.jsonparse import loads_json
 
 MERMAID_SYSTEM_PROMPT = """你是 Mermaid 图表生成专家。
 
@@ -270,7 +271,7 @@ def _parse_code_response(response: str) -> Dict[str, Any]:
         else:
             json_str = response
         
-        return json.loads(json_str.strip())
+        return loads_json(json_str.strip())
         
     except (json.JSONDecodeError, IndexError):
         # 尝试直接提取代码块
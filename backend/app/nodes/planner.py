@@ -12,6 +12,7 @@ from typing import Dict, Any, List
 
 from app.services.model_client import model_client
 from app.config import settings
+from app.utils.jsonparse import loads_json
 from app.schemas.workflow import Skill
 
 PLANNER_SYSTEM_PROMPT = """你是红点集团内部文档工具的【执行规划师】。
@@ -122,7 +123,7 @@ async def run(state: Any) -> Dict[str, Any]:
         elif "```" in text:
             text = text.split("```")[1].split("```")[0].strip()
         
-        skills_data = json.loads(text)
+        skills_data = loads_json(text)
         
         # 验证并补全 ID
         skills = []
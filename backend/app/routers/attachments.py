@@ -34,9 +34,8 @@ async def upload_attachment(
     if not doc:
         raise HTTPException(status_code=404, detail="文档不存在")
     
-    # 保存文件
-    content = await file.read()
-    filepath = await save_file(content, file.filename, "attachments")
+    # 保存文件（按块流式写入）
+    filepath = await save_file(file, file.filename, "attachments")
     
     # 创建附件记录
     attachment = Attachment(
@@ -2,11 +2,14 @@
 导出路由
 """
 import os
+import shutil
 import asyncio
+import tempfile
 from pathlib import Path
 from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
@@ -171,43 +174,39 @@ async def export_doc_sync(
     if not latest_version or not latest_version.content_md:
         raise HTTPException(status_code=400, detail="文档内容为空")
     
+    # 创建临时目录（响应发送完后由后台任务清理）
+    tmpdir = tempfile.mkdtemp()
     try:
-        # 创建临时目录
-        import tempfile
-        with tempfile.TemporaryDirectory() as tmpdir:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"{doc.title}_{timestamp}.docx"
-            output_path = os.path.join(tmpdir, filename)
-            
-            # 执行导出
-            result = await export_service.export_to_docx(
-                markdown=_apply_generated_images(latest_version.content_md, latest_version.doc_variables or {}),
-                output_path=output_path,
-                title=doc.title
-            )
-            
-            if not result["success"]:
-                raise HTTPException(
-                    status_code=500, 
-                    detail=f"导出失败: {'; '.join(result['errors'])}"
-                )
-            
-            # 读取文件内容
-            with open(output_path, "rb") as f:
-                file_content = f.read()
-            
-            # 返回文件
-            return StreamingResponse(
-                iter([file_content]),
-                media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                headers={
-                    "Content-Disposition": f'attachment; filename="{filename}"'
-                }
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"{doc.title}_{timestamp}.docx"
+        output_path = os.path.join(tmpdir, filename)
+        
+        # 执行导出
+        result = await export_service.export_to_docx(
+            markdown=_apply_generated_images(latest_version.content_md, latest_version.doc_variables or {}),
+            output_path=output_path,
+            title=doc.title
+        )
+        
+        if not result["success"]:
+            raise HTTPException(
+                status_code=500, 
+                detail=f"导出失败: {'; '.join(result['errors'])}"
             )
+        
+        # 直接从磁盘分块发送文件（服务器支持时走 sendfile 零拷贝），不整体读入内存
+        return FileResponse(
+            output_path,
+            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+            filename=filename,
+            background=BackgroundTask(shutil.rmtree, tmpdir, ignore_errors=True),
+        )
             
     except HTTPException:
+        shutil.rmtree(tmpdir, ignore_errors=True)
         raise
     except Exception as e:
+        shutil.rmtree(tmpdir, ignore_errors=True)
         raise HTTPException(status_code=500, detail=f"导出失败: {str(e)}")
 
 
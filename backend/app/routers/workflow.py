@@ -5,7 +5,7 @@ import os
 import asyncio
 from typing import List, Dict, Any
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, BackgroundTasks, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
@@ -582,13 +582,16 @@ async def send_chat_message(
     doc_id: str,
     req: WorkflowRunRequest,
     background_tasks: BackgroundTasks,
+    min_flush_bytes: int = Query(0, ge=0, description="增量内容攒够多少字节再推送（0 = 每帧立即推送）"),
+    max_flush_interval_ms: int = Query(25, ge=0, description="距上次推送超过该毫秒数时直接推送"),
     user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
     发送对话消息（触发中控节点，流式输出）
     
-    这是主要的用户交互入口
+    这是主要的用户交互入口。对话界面保持默认（逐帧推送）即可；
+    批量消费的客户端可调大 min_flush_bytes / max_flush_interval_ms 减少推送次数。
     """
     from app.config import settings
     
@@ -665,6 +668,10 @@ async def send_chat_message(
         "error": None,
         "retry_count": 0,
         "ready_to_write": False,
+        "stream_options": {
+            "min_flush_bytes": min_flush_bytes,
+            "max_flush_interval_ms": max_flush_interval_ms,
+        },
     }
     
     # Plan 阶段：启动后台任务（仅 controller 流式）
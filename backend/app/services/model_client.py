@@ -10,19 +10,139 @@ DashScope 模型客户端封装
 - 工具调用（Function Calling）
 """
 import os
+import re
+import json
+import hashlib
+import asyncio
+import importlib.util
+from contextlib import aclosing
+import httpx
 import dashscope
 from dashscope import Generation, MultiModalConversation
-from typing import List, Dict, Any, Optional, Tuple, AsyncGenerator
+from typing import List, Dict, Any, Optional, Tuple, AsyncGenerator, Callable
 from app.config import settings
 
+# orjson 解析/序列化更快，且可直接处理 bytes；未安装时回退标准库
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+    _json_dumps_bytes = orjson.dumps
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps_bytes(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+# 文本生成 HTTP 接口（相对 dashscope_base_url）
+GENERATION_PATH = "/services/aigc/text-generation/generation"
+# SDK 调用参数中不属于 HTTP 请求 parameters 的字段
+_NON_PARAMETER_KEYS = frozenset({"api_key", "model", "messages", "stream"})
+# 批量输出整体被 ```json ... ``` 包裹时的外层代码块（只匹配首尾，条目内容里的代码块不受影响）
+_OUTER_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.DOTALL)
+
+
+# ===== message 字段访问（按类型缓存访问方式）=====
+
+def _dict_field(message: Any, field: str) -> Any:
+    return message.get(field)
+
+
+def _attr_field(message: Any, field: str) -> Any:
+    return getattr(message, field, None)
+
+
+def _guarded_attr_field(message: Any, field: str) -> Any:
+    try:
+        return getattr(message, field)
+    except Exception:
+        return None
+
+
+# type -> 访问函数；类型数量上限防止动态生成的类（如 MagicMock）无限增长
+_FIELD_ACCESSORS: Dict[type, Callable[[Any, str], Any]] = {}
+_FIELD_ACCESSORS_MAX = 64
+
+# SDK 全局 API URL（模块导入时设置一次，不随 DashScopeClient 实例化重复修改全局状态）
+dashscope.base_http_api_url = settings.dashscope_base_url
+
 
 class DashScopeClient:
     """DashScope 统一客户端"""
 
+    __slots__ = ("api_key", "_cache_hits", "_cache_misses", "_inflight", "_http")
+
     def __init__(self):
         self.api_key = settings.dashscope_api_key
-        # 设置全局 API URL
-        dashscope.base_http_api_url = settings.dashscope_base_url
+        # 上下文缓存命中统计（usage.prompt_tokens_details.cached_tokens > 0 记为命中）
+        self._cache_hits = 0
+        self._cache_misses = 0
+        # 进行中的非流式请求：参数指纹 -> Future（用于合并相同的并发请求）
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # 流式调用用的 HTTP 连接池，首次流式调用时才创建（见 _get_http）
+        self._http: Optional[httpx.AsyncClient] = None
+
+    def _get_http(self) -> httpx.AsyncClient:
+        """
+        流式调用直接走 HTTP SSE（原生异步）；read 不设超时，长文本生成可能持续数分钟。
+        同一实例的多次 stream_call 复用这个连接池（keep-alive），装了 h2 时开启 HTTP/2 多路复用。
+        call / call_with_thinking / call_with_file 走 SDK 的 Generation.call，不经过这里。
+        """
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=settings.dashscope_base_url,
+                timeout=httpx.Timeout(10.0, read=None),
+                limits=httpx.Limits(max_keepalive_connections=32, max_connections=128, keepalive_expiry=60.0),
+                http2=importlib.util.find_spec("h2") is not None,
+            )
+        return self._http
+
+    async def _generation_call(self, call_kwargs: Dict[str, Any]) -> Tuple[Any, Optional[Dict[str, int]]]:
+        """
+        执行非流式 Generation.call（dashscope SDK 是同步的，在异步环境中使用 run_in_executor）
+
+        返回 (response, usage)：usage 只在真正发出的那次调用上提取一次（非 200 响应为 None）。
+
+        开启 model_coalesce_inflight 时，参数完全相同的确定性并发请求（temperature=0 或指定了 seed）
+        会合并为一次调用：后到的请求直接等待正在进行的那次调用的结果。采样请求各自独立调用，
+        否则多个请求会拿到同一份采样结果。
+        """
+        loop = asyncio.get_event_loop()
+
+        async def _run() -> Tuple[Any, Optional[Dict[str, int]]]:
+            response = await loop.run_in_executor(None, lambda: Generation.call(**call_kwargs))
+            usage = self._extract_usage(response) if response.status_code == 200 else None
+            return response, usage
+
+        if not (settings.model_coalesce_inflight and self._is_deterministic(call_kwargs)):
+            return await _run()
+
+        key = self._request_key(call_kwargs)
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(_run())
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield：某个等待方被取消时不影响其他共享同一次调用的请求
+        return await asyncio.shield(future)
+
+    @staticmethod
+    def _is_deterministic(call_kwargs: Dict[str, Any]) -> bool:
+        """相同参数是否应得到相同输出（temperature=0 或指定了 seed），只有这类请求才合并"""
+        return call_kwargs.get("temperature") == 0 or call_kwargs.get("seed") is not None
+
+    @staticmethod
+    def _request_key(call_kwargs: Dict[str, Any]) -> str:
+        """请求参数指纹（不含 api_key），用于合并相同的并发请求"""
+        params = {k: v for k, v in call_kwargs.items() if k != "api_key"}
+        raw = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    async def aclose(self):
+        """关闭 HTTP 连接池（应用关闭时调用；未发起过流式调用时无需关闭）"""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
 
     def _ensure_api_key(self):
         """确保 API Key 已设置"""
@@ -38,17 +158,49 @@ class DashScopeClient:
         - pydantic/对象属性
         - dict
         - 访问缺失字段时抛 KeyError 的对象
+
+        流式输出每一帧都会调用，按 message 类型缓存访问方式，常规路径不再走异常分支。
         """
+        cls = type(message)
+        accessor = _FIELD_ACCESSORS.get(cls)
+        if accessor is None:
+            accessor = _dict_field if isinstance(message, dict) else _attr_field
+            if len(_FIELD_ACCESSORS) < _FIELD_ACCESSORS_MAX:
+                _FIELD_ACCESSORS[cls] = accessor
         try:
-            if isinstance(message, dict):
-                v = message.get(field, default)
-                return v or default
-            v = getattr(message, field)  # 可能抛 KeyError
-            return v or default
+            v = accessor(message, field)
         except Exception:
+            # 缺字段时抛非 AttributeError 的类型：之后改用带兜底的访问方式
+            if len(_FIELD_ACCESSORS) < _FIELD_ACCESSORS_MAX or cls in _FIELD_ACCESSORS:
+                _FIELD_ACCESSORS[cls] = _guarded_attr_field
             return default
+        return v or default
 
-    async def call(
+    def _extract_usage(self, response: Any) -> Dict[str, int]:
+        """
+        从响应中提取 token 用量（含上下文缓存命中的 cached_tokens），并更新命中统计。
+
+        DashScope 命中上下文缓存时会在 usage.prompt_tokens_details.cached_tokens 中返回命中的 token 数；
+        不同 SDK 版本下 usage 可能是对象或 dict，缺字段时统一按 0 处理。
+        """
+        usage = self._safe_get_message_field(response, "usage", None)
+        details = self._safe_get_message_field(usage, "prompt_tokens_details", None)
+        result = {
+            "input_tokens": int(self._safe_get_message_field(usage, "input_tokens", 0)),
+            "output_tokens": int(self._safe_get_message_field(usage, "output_tokens", 0)),
+            "cached_tokens": int(self._safe_get_message_field(details, "cached_tokens", 0)),
+        }
+        if result["cached_tokens"] > 0:
+            self._cache_hits += 1
+        else:
+            self._cache_misses += 1
+        if settings.debug:
+            print(f"[ModelClient] usage: input={result['input_tokens']}, "
+                  f"output={result['output_tokens']}, cached={result['cached_tokens']} "
+                  f"(hits={self._cache_hits}, misses={self._cache_misses})")
+        return result
+
+    async def call_with_usage(
         self,
         model: str,
         messages: List[Dict[str, str]],
@@ -60,9 +212,9 @@ class DashScopeClient:
         search_options: Optional[Dict[str, Any]] = None,
         tools: Optional[List[Dict[str, Any]]] = None,
         **kwargs
-    ) -> str:
+    ) -> Tuple[str, Dict[str, int]]:
         """
-        调用对话模型（非流式）
+        调用对话模型（非流式），同时返回 token 用量
 
         Args:
             model: 模型名称
@@ -73,7 +225,7 @@ class DashScopeClient:
             tools: 工具定义列表
 
         Returns:
-            模型输出文本
+            (content, usage) - 模型输出文本和用量 {"input_tokens", "output_tokens", "cached_tokens"}
         """
         api_key = self._ensure_api_key()
 
@@ -103,23 +255,134 @@ class DashScopeClient:
         if tools:
             call_kwargs["tools"] = tools
 
-        # 合并额外参数
-        call_kwargs.update(kwargs)
+        # 合并额外参数（常规调用不带额外参数，跳过空合并）
+        if kwargs:
+            call_kwargs.update(kwargs)
 
-        # 同步调用（dashscope SDK 是同步的，在异步环境中使用 run_in_executor）
-        import asyncio
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None,
-            lambda: Generation.call(**call_kwargs)
-        )
+        response, usage = await self._generation_call(call_kwargs)
 
         if response.status_code == 200:
-            return response.output.choices[0].message.content
+            return response.output.choices[0].message.content, usage
         else:
             raise Exception(f"API 调用失败: HTTP {response.status_code}, "
                           f"错误码: {response.code}, 错误信息: {response.message}")
 
+    async def call(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        **kwargs
+    ) -> str:
+        """
+        调用对话模型（非流式）
+
+        参数同 call_with_usage，只返回模型输出文本。
+        """
+        content, _ = await self.call_with_usage(model, messages, **kwargs)
+        return content
+
+    async def call_batch(
+        self,
+        model: str,
+        shared_system_prompt: str,
+        items: List[Dict[str, Any]],
+        item_schema: str,
+        batch_size: Optional[int] = None,
+        **kwargs
+    ) -> List[str]:
+        """
+        批量调用：把多个互相独立的条目合并到一次调用中（共享前缀 + 编号条目 + JSON 数组输出）
+
+        Prompt 结构：
+            system: shared_system_prompt + 批量输出说明 + item_schema（不含变量，保证前缀一致）
+            user:   [1] {...}\n[2] {...}\n...
+
+        单条目过长（> model_batch_max_item_chars）时合并会明显降低质量，这类条目逐条调用；
+        模型输出缺失/无法解析的条目同样回退为逐条调用。
+
+        Args:
+            model: 模型名称
+            shared_system_prompt: 所有条目共用的系统提示词
+            items: 条目列表（每个条目为 dict，会序列化为 JSON 放入 user 消息）
+            item_schema: 单个条目输出的格式说明
+            batch_size: 每次调用合并的条目数（默认 settings.model_batch_size）
+
+        Returns:
+            与 items 一一对应的输出文本列表
+        """
+        batch_size = max(1, batch_size or settings.model_batch_size)
+        serialized = [json.dumps(item, ensure_ascii=False) for item in items]
+        results: List[Optional[str]] = [None] * len(items)
+
+        batchable = [i for i, text in enumerate(serialized) if len(text) <= settings.model_batch_max_item_chars]
+        system_prompt = (
+            f"{shared_system_prompt}\n\n"
+            "【批量输出要求】\n"
+            "用户会一次给出多个编号条目 [1]、[2]……，请逐个独立完成。\n"
+            "只输出一个 JSON 数组，第 j 个元素对应第 j 个条目，格式：[{\"id\": j, \"output\": \"...\"}]\n"
+            f"单个条目 output 的要求：\n{item_schema}"
+        )
+
+        async def _run_batch(indices: List[int]):
+            user_content = "\n".join(f"[{j + 1}] {serialized[i]}" for j, i in enumerate(indices))
+            response = await self.call(
+                model,
+                [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_content},
+                ],
+                **kwargs
+            )
+            for j, output in self._parse_batch_response(response).items():
+                if 1 <= j <= len(indices):
+                    results[indices[j - 1]] = output
+
+        chunks = [batchable[k:k + batch_size] for k in range(0, len(batchable), batch_size)]
+        await asyncio.gather(*[_run_batch(chunk) for chunk in chunks if len(chunk) > 1])
+
+        async def _run_single(i: int):
+            results[i] = await self.call(
+                model,
+                [
+                    {"role": "system", "content": f"{shared_system_prompt}\n\n{item_schema}"},
+                    {"role": "user", "content": serialized[i]},
+                ],
+                **kwargs
+            )
+
+        await asyncio.gather(*[_run_single(i) for i, r in enumerate(results) if r is None])
+        return results
+
+    @staticmethod
+    def _parse_batch_response(response: str) -> Dict[int, str]:
+        """解析批量调用输出的 JSON 数组，返回 {条目编号: 输出文本}（解析失败返回空 dict）"""
+        text = (response or "").strip()
+        fenced = _OUTER_FENCE_RE.fullmatch(text)
+        if fenced:
+            text = fenced.group(1)
+        start, end = text.find("["), text.rfind("]")
+        if start == -1 or end <= start:
+            return {}
+        try:
+            data = json.loads(text[start:end + 1])
+        except json.JSONDecodeError:
+            return {}
+
+        parsed: Dict[int, str] = {}
+        for pos, entry in enumerate(data if isinstance(data, list) else []):
+            if isinstance(entry, dict):
+                try:
+                    idx = int(entry.get("id", pos + 1))
+                except (TypeError, ValueError):
+                    continue
+                output = entry.get("output")
+            else:
+                idx, output = pos + 1, entry
+            if output is None:
+                continue
+            parsed[idx] = output if isinstance(output, str) else json.dumps(output, ensure_ascii=False)
+        return parsed
+
     async def call_with_thinking(
         self,
         model: str,
@@ -151,14 +414,10 @@ class DashScopeClient:
         }
         if thinking_budget is not None:
             call_kwargs["thinking_budget"] = int(thinking_budget)
-        call_kwargs.update(kwargs)
+        if kwargs:
+            call_kwargs.update(kwargs)
 
-        import asyncio
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None,
-            lambda: Generation.call(**call_kwargs)
-        )
+        response, _ = await self._generation_call(call_kwargs)
 
         if response.status_code == 200:
             message = response.output.choices[0].message
@@ -180,11 +439,16 @@ class DashScopeClient:
         enable_search: bool = False,
         search_options: Optional[Dict[str, Any]] = None,
         tools: Optional[List[Dict[str, Any]]] = None,
+        min_flush_bytes: int = 0,
+        max_flush_interval_ms: int = 25,
         **kwargs
     ) -> AsyncGenerator[Dict[str, Any], None]:
         """
         流式调用对话模型
 
+        默认直接请求 DashScope 的 HTTP SSE 接口（原生异步，不占用线程）；
+        settings.dashscope_http_stream=False 时回退到 SDK（线程 + 队列）实现。
+
         Args:
             model: 模型名称
             messages: 消息列表
@@ -192,6 +456,10 @@ class DashScopeClient:
             temperature: 温度参数
             enable_thinking: 是否开启深度思考模式
             tools: 工具列表
+            min_flush_bytes: 增量内容攒够多少字节再推送（0 = 每帧立即推送，适合对话界面）
+            max_flush_interval_ms: 距上次推送超过该时间则不等攒够、直接推送；
+                批量消费的场景可调大 min_flush_bytes / max_flush_interval_ms 减少事件数。
+                第一帧总是立即推送，不影响首字延迟。
 
         Yields:
             流式事件字典:
@@ -226,125 +494,308 @@ class DashScopeClient:
         if tools:
             call_kwargs["tools"] = tools
 
-        call_kwargs.update(kwargs)
+        if kwargs:
+            call_kwargs.update(kwargs)
+
+        if settings.dashscope_http_stream:
+            source = self._stream_call_http(call_kwargs)
+        else:
+            source = self._stream_call_sdk(call_kwargs)
+        if min_flush_bytes > 0:
+            source = self._coalesce_deltas(source, min_flush_bytes, max_flush_interval_ms)
 
-        import asyncio
+        # 提前关闭/取消时显式关闭下游生成器，及时释放连接或停止 SDK 线程
+        try:
+            async for item in source:
+                yield item
+        finally:
+            await source.aclose()
+
+    @staticmethod
+    async def _coalesce_deltas(
+        source: AsyncGenerator[Dict[str, Any], None],
+        min_flush_bytes: int,
+        max_flush_interval_ms: int,
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        合并连续的同类型增量事件（thinking/content）：攒够 min_flush_bytes 或距上次推送
+        超过 max_flush_interval_ms 时推送一次；其他事件（tool_call/done/error）到来前先推送缓冲。
+
+        缓冲非空时等待下一帧最多到推送期限为止：上游停顿（模型思考、网络抖动）时也会按时推送，
+        不会把已收到的内容压到下一帧到来。
+        """
+        loop = asyncio.get_event_loop()
+        max_interval = max_flush_interval_ms / 1000
+        pending_type: Optional[str] = None
+        pending: List[str] = []
+        pending_bytes = 0
+        last_flush: Optional[float] = None
+        # 正在读取的下一帧（超时推送后继续等同一个读取，不取消上游生成器）
+        next_item: Optional[asyncio.Future] = None
+
+        def flush() -> Dict[str, Any]:
+            nonlocal pending_type, pending, pending_bytes, last_flush
+            event = {"type": pending_type, "content": "".join(pending)}
+            pending_type, pending, pending_bytes = None, [], 0
+            last_flush = loop.time()
+            return event
+
+        try:
+            while True:
+                if next_item is None:
+                    next_item = asyncio.ensure_future(source.__anext__())
+                if pending:
+                    timeout = max(0.0, last_flush + max_interval - loop.time())
+                    done, _ = await asyncio.wait({next_item}, timeout=timeout)
+                    if not done:
+                        yield flush()
+                        continue
+                try:
+                    item = await next_item
+                except StopAsyncIteration:
+                    break
+                finally:
+                    next_item = None
+
+                if item["type"] not in ("thinking", "content"):
+                    if pending:
+                        yield flush()
+                    yield item
+                    continue
+
+                if pending and item["type"] != pending_type:
+                    yield flush()
+                pending_type = item["type"]
+                pending.append(item["content"])
+                pending_bytes += len(item["content"].encode("utf-8"))
+
+                if (
+                    last_flush is None  # 第一帧立即推送
+                    or pending_bytes >= min_flush_bytes
+                    or loop.time() - last_flush >= max_interval
+                ):
+                    yield flush()
+
+            if pending:
+                yield flush()
+        finally:
+            if next_item is not None:
+                # 提前关闭时先取消并等待进行中的读取，上游生成器空闲后才能 aclose
+                next_item.cancel()
+                await asyncio.gather(next_item, return_exceptions=True)
+            await source.aclose()
+
+    async def _stream_call_http(self, call_kwargs: Dict[str, Any]) -> AsyncGenerator[Dict[str, Any], None]:
+        """HTTP SSE 流式调用（httpx 原生异步）"""
+        api_key = call_kwargs["api_key"]
+        model = call_kwargs["model"]
+
+        # 请求体：SDK 参数 → HTTP 接口格式（model / input.messages / parameters）
+        payload = {
+            "model": model,
+            "input": {"messages": call_kwargs["messages"]},
+            "parameters": {k: v for k, v in call_kwargs.items() if k not in _NON_PARAMETER_KEYS},
+        }
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+            "X-DashScope-SSE": "enable",
+        }
+
+        acc = self._new_stream_accumulator()
+        try:
+            # 消费方提前关闭生成器（aclose / 取消）时，async with 会随之关闭响应、归还连接
+            async with self._get_http().stream(
+                "POST", GENERATION_PATH, content=_json_dumps_bytes(payload), headers=headers
+            ) as resp:
+                if resp.status_code != 200:
+                    body = (await resp.aread()).decode("utf-8", errors="ignore")
+                    yield {"type": "error", "message": f"API 错误: HTTP {resp.status_code} - {body}"}
+                    return
+
+                async with aclosing(self._iter_sse_data(resp)) as frames:
+                    async for data in frames:
+                        chunk = _json_loads(data)
+                        output = chunk.get("output")
+                        if not output:
+                            # 错误帧：{"code": "...", "message": "...", "request_id": "..."}
+                            if chunk.get("code"):
+                                yield {"type": "error", "message": f"API 错误: {chunk.get('code')} - {chunk.get('message')}"}
+                                break
+                            continue
+                        choices = output.get("choices") or []
+                        if choices:
+                            for event in self._consume_stream_message(choices[0].get("message") or {}, acc):
+                                yield event
+        except Exception as e:
+            yield {"type": "error", "message": str(e)}
+            return
+
+        yield self._stream_done_event(acc)
+
+    @staticmethod
+    async def _iter_sse_data(resp: httpx.Response) -> AsyncGenerator[bytes, None]:
+        """
+        按字节读取 SSE 响应并按 b"\n" 切行，产出每个 data: 行的负载（bytes，直接交给 orjson）
+
+        id:/event:/:HTTP_STATUS/ 之类的元信息行直接跳过；不做逐行 str 解码。
+        """
+        buf = b""
+        async for raw in resp.aiter_bytes():
+            buf += raw
+            *lines, buf = buf.split(b"\n")
+            for line in lines:
+                if line.startswith(b"data:"):
+                    yield line[5:]
+        if buf.startswith(b"data:"):
+            yield buf[5:]
+
+    @staticmethod
+    def _new_stream_accumulator() -> Dict[str, Any]:
+        """流式累积状态：完整思考/回复内容 + 工具调用 {index: tool_call_dict}"""
+        return {"reasoning": "", "content": "", "tool_calls": {}}
+
+    def _consume_stream_message(self, message: Any, acc: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """处理一帧增量 message（对象或 dict），累积到 acc，返回需要对外推送的事件"""
+        events = []
+
+        # 思考内容
+        reasoning_delta = self._safe_get_message_field(message, "reasoning_content", "")
+        if reasoning_delta:
+            acc["reasoning"] += reasoning_delta
+            events.append({"type": "thinking", "content": reasoning_delta})
+
+        # 工具调用 (tool_calls)
+        # DashScope 流式返回 tool_calls 是增量的
+        t_calls = self._safe_get_message_field(message, "tool_calls", None)
+        if t_calls:
+            full_tool_calls_map = acc["tool_calls"]
+            # 累积工具调用
+            for tc in t_calls:
+                # 兼容对象访问和字典访问
+                idx = 0
+                if isinstance(tc, dict):
+                    idx = tc.get("index", 0)
+                else:
+                    idx = getattr(tc, "index", 0)
+
+                if idx not in full_tool_calls_map:
+                    full_tool_calls_map[idx] = {
+                        "index": idx,
+                        "id": "",
+                        "type": "function",
+                        "function": {
+                            "name": "",
+                            "arguments": ""
+                        }
+                    }
+
+                # 更新 id/type (通常在第一帧)
+                if isinstance(tc, dict):
+                    tc_id = tc.get("id", "")
+                    tc_type = tc.get("type", "")
+                    func = tc.get("function", {})
+                else:
+                    tc_id = getattr(tc, "id", "")
+                    tc_type = getattr(tc, "type", "")
+                    func = getattr(tc, "function", None)
+
+                if tc_id:
+                    full_tool_calls_map[idx]["id"] = tc_id
+                if tc_type:
+                    full_tool_calls_map[idx]["type"] = tc_type
+
+                # 更新 function
+                if func:
+                    if isinstance(func, dict):
+                        name = func.get("name", "")
+                        args = func.get("arguments", "")
+                    else:
+                        name = getattr(func, "name", "")
+                        args = getattr(func, "arguments", "")
+
+                    if name:
+                        full_tool_calls_map[idx]["function"]["name"] = name
+                    if args:
+                        full_tool_calls_map[idx]["function"]["arguments"] += args
+
+            # 将增量 tool_calls 传递出去（保持增量结构，供 workflow.py 累积）
+            events.append({"type": "tool_call", "tool_calls": t_calls})
+
+        # 回复内容
+        content_delta = self._safe_get_message_field(message, "content", "")
+        if content_delta:
+            acc["content"] += content_delta
+            events.append({"type": "content", "content": content_delta})
+
+        return events
+
+    @staticmethod
+    def _stream_done_event(acc: Dict[str, Any]) -> Dict[str, Any]:
+        """构造流式完成事件（含最终完整的 tool_calls 列表）"""
+        full_tool_calls_map = acc["tool_calls"]
+        return {
+            "type": "done",
+            "reasoning": acc["reasoning"],
+            "content": acc["content"],
+            "tool_calls": [full_tool_calls_map[k] for k in sorted(full_tool_calls_map.keys())]
+        }
+
+    async def _stream_call_sdk(self, call_kwargs: Dict[str, Any]) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        SDK 流式调用（同步 Generation.call 在线程中运行，通过队列转为异步事件）
+
+        消费方提前停止迭代（客户端断开、下游异常、任务取消）时，生成器的 finally 会通知
+        生产线程停止读取并关闭 SDK 的响应流，避免线程继续把剩余 token 读完、占着连接。
+        """
         import queue
         import threading
 
         # 使用队列在同步生成器和异步生成器之间传递数据
         q: queue.Queue = queue.Queue()
-        full_reasoning = ""
-        full_content = ""
-        # 用于累积工具调用 {index: tool_call_dict}
-        full_tool_calls_map = {}
+        acc = self._new_stream_accumulator()
+        cancel_event = threading.Event()
 
         def sync_stream():
-            nonlocal full_reasoning, full_content, full_tool_calls_map
+            responses = None
             try:
                 responses = Generation.call(**call_kwargs)
                 for response in responses:
+                    if cancel_event.is_set():
+                        break
                     if response.status_code == 200:
                         choice = response.output.choices[0] if response.output.choices else None
                         if choice:
-                            message = choice.message
-                            # 思考内容
-                            reasoning_delta = self._safe_get_message_field(message, "reasoning_content", "")
-                            if reasoning_delta:
-                                full_reasoning += reasoning_delta
-                                q.put({"type": "thinking", "content": reasoning_delta})
-                            
-                            # 工具调用 (tool_calls)
-                            # DashScope 流式返回 tool_calls 是增量的
-                            t_calls = self._safe_get_message_field(message, "tool_calls", None)
-                            if t_calls:
-                                # 累积工具调用
-                                for tc in t_calls:
-                                    # 兼容对象访问和字典访问
-                                    idx = 0
-                                    if isinstance(tc, dict):
-                                        idx = tc.get("index", 0)
-                                    else:
-                                        idx = getattr(tc, "index", 0)
-                                    
-                                    if idx not in full_tool_calls_map:
-                                        full_tool_calls_map[idx] = {
-                                            "index": idx,
-                                            "id": "",
-                                            "type": "function",
-                                            "function": {
-                                                "name": "",
-                                                "arguments": ""
-                                            }
-                                        }
-                                    
-                                    # 更新 id/type (通常在第一帧)
-                                    if isinstance(tc, dict):
-                                        tc_id = tc.get("id", "")
-                                        tc_type = tc.get("type", "")
-                                        func = tc.get("function", {})
-                                    else:
-                                        tc_id = getattr(tc, "id", "")
-                                        tc_type = getattr(tc, "type", "")
-                                        func = getattr(tc, "function", None)
-
-                                    if tc_id:
-                                        full_tool_calls_map[idx]["id"] = tc_id
-                                    if tc_type:
-                                        full_tool_calls_map[idx]["type"] = tc_type
-                                    
-                                    # 更新 function
-                                    if func:
-                                        if isinstance(func, dict):
-                                            name = func.get("name", "")
-                                            args = func.get("arguments", "")
-                                        else:
-                                            name = getattr(func, "name", "")
-                                            args = getattr(func, "arguments", "")
-                                            
-                                        if name:
-                                            full_tool_calls_map[idx]["function"]["name"] = name
-                                        if args:
-                                            full_tool_calls_map[idx]["function"]["arguments"] += args
-
-                                # 将增量 tool_calls 传递出去（保持增量结构，供 workflow.py 累积）
-                                q.put({"type": "tool_call", "tool_calls": t_calls})
-
-                            # 回复内容
-                            content_delta = self._safe_get_message_field(message, "content", "")
-                            if content_delta:
-                                full_content += content_delta
-                                q.put({"type": "content", "content": content_delta})
+                            for event in self._consume_stream_message(choice.message, acc):
+                                q.put(event)
                     else:
                         q.put({"type": "error", "message": f"API 错误: {response.code} - {response.message}"})
                         break
-                
-                # 构造最终完整的 tool_calls 列表
-                final_tool_calls = [full_tool_calls_map[k] for k in sorted(full_tool_calls_map.keys())]
-                
+
                 # 完成
-                q.put({
-                    "type": "done", 
-                    "reasoning": full_reasoning, 
-                    "content": full_content,
-                    "tool_calls": final_tool_calls
-                })
+                q.put(self._stream_done_event(acc))
             except Exception as e:
                 q.put({"type": "error", "message": str(e)})
             finally:
+                if cancel_event.is_set() and hasattr(responses, "close"):
+                    responses.close()
                 q.put(None)  # 结束标记
 
-        # 在线程中运行同步流式调用
-        thread = threading.Thread(target=sync_stream)
+        # 在线程中运行同步流式调用（daemon：取消后不阻塞进程退出）
+        thread = threading.Thread(target=sync_stream, daemon=True)
         thread.start()
 
         # 异步读取队列
         loop = asyncio.get_event_loop()
-        while True:
-            item = await loop.run_in_executor(None, q.get)
-            if item is None:
-                break
-            yield item
+        try:
+            while True:
+                item = await loop.run_in_executor(None, q.get)
+                if item is None:
+                    break
+                yield item
+        finally:
+            # 正常结束时线程已退出；提前关闭/取消时通知线程停止（不在事件循环里 join 等待）
+            cancel_event.set()
 
         thread.join()
 
@@ -390,14 +841,10 @@ class DashScopeClient:
             "result_format": "message",
             "max_tokens": max_tokens,
         }
-        call_kwargs.update(kwargs)
+        if kwargs:
+            call_kwargs.update(kwargs)
 
-        import asyncio
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None,
-            lambda: Generation.call(**call_kwargs)
-        )
+        response, _ = await self._generation_call(call_kwargs)
 
         if response.status_code == 200:
             return response.output.choices[0].message.content
@@ -417,7 +864,6 @@ class DashScopeClient:
         """
         api_key = self._ensure_api_key()
 
-        import asyncio
         from dashscope import Files
 
         loop = asyncio.get_event_loop()
@@ -467,7 +913,6 @@ class DashScopeClient:
             }
         ]
 
-        import asyncio
         loop = asyncio.get_event_loop()
         response = await loop.run_in_executor(
             None,
@@ -509,6 +954,12 @@ model_client = DashScopeClient()
 
 
 # ===== 便捷函数 =====
+#
+# 上下文缓存按消息前缀匹配（≥1024 token 的相同前缀才可能命中），构造 messages 时保持稳定顺序：
+#   1) system：角色设定 → 任务说明 → 输出格式/Schema（模块级常量，不掺入任何变量）
+#   2) 对话历史等按时间追加的内容
+#   3) 本次请求的变量数据（文档变量、附件摘要、章节描述等）放在最后
+# 这样不同请求的开头部分逐字节一致，命中情况可通过 call_with_usage 返回的 cached_tokens 观察。
 
 async def call_controller(messages: List[Dict[str, str]], **kwargs) -> Tuple[str, str]:
     """调用中控模型（带思考模式）"""
@@ -537,6 +988,38 @@ async def call_diagram(messages: List[Dict[str, str]], **kwargs) -> str:
     )
 
 
+async def call_writer_batch(
+    shared_system_prompt: str,
+    items: List[Dict[str, Any]],
+    item_schema: str,
+    **kwargs
+) -> List[str]:
+    """批量调用文档撰写模型（多个独立章节合并为一次调用）"""
+    return await model_client.call_batch(
+        model=settings.model_writer,
+        shared_system_prompt=shared_system_prompt,
+        items=items,
+        item_schema=item_schema,
+        **kwargs
+    )
+
+
+async def call_diagram_batch(
+    shared_system_prompt: str,
+    items: List[Dict[str, Any]],
+    item_schema: str,
+    **kwargs
+) -> List[str]:
+    """批量调用图文助手模型（多个独立图表合并为一次调用）"""
+    return await model_client.call_batch(
+        model=settings.model_diagram,
+        shared_system_prompt=shared_system_prompt,
+        items=items,
+        item_schema=item_schema,
+        **kwargs
+    )
+
+
 async def call_assembler(messages: List[Dict[str, str]], **kwargs) -> str:
     """调用全文整合模型"""
     return await model_client.call(
@@ -3,6 +3,7 @@
 """
 from app.utils.auth import create_access_token, decode_access_token
 from app.utils.storage import save_file, get_file_url, ensure_dir
+from app.utils.jsonparse import loads_json
 
 __all__ = [
     "create_access_token",
@@ -10,4 +11,5 @@ __all__ = [
     "save_file",
     "get_file_url",
     "ensure_dir",
+    "loads_json",
 ]
@@ -1,25 +1,63 @@
 """
 认证工具函数
 """
-from passlib.context import CryptContext
-from jose import jwt, JWTError
+import time
+import bcrypt
+import jwt
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from functools import lru_cache
+from typing import Optional, Dict, Any, Tuple
+
+from jwt.algorithms import get_default_algorithms
 
 from app.config import settings
 
-# 密码哈希上下文
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# 已验证 Token 的 LRU+TTL 缓存：token -> (缓存失效时刻(monotonic), payload)
+# 同一用户会话内会反复携带同一个 Bearer Token，命中时省去 HMAC 校验和 JSON 解析。
+# Token 自带 exp，命中时仍会检查 exp，缓存 TTL 只决定多久重新完整校验一次。
+_TOKEN_CACHE_MAX_SIZE = 4096
+_TOKEN_CACHE_TTL_SECONDS = 60.0
+_token_cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+# bcrypt 只使用密码的前 72 字节（与 passlib 的截断行为保持一致，已有哈希可继续校验）
+_BCRYPT_MAX_BYTES = 72
 
 
 def hash_password(password: str) -> str:
-    """哈希密码"""
-    return pwd_context.hash(password)
+    """哈希密码（bcrypt）"""
+    salt = bcrypt.gensalt(rounds=settings.bcrypt_rounds)
+    return bcrypt.hashpw(password.encode("utf-8")[:_BCRYPT_MAX_BYTES], salt).decode("ascii")
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """验证密码"""
-    return pwd_context.verify(plain_password, hashed_password)
+    """验证密码（哈希格式无效时返回 False）"""
+    try:
+        return bcrypt.checkpw(
+            plain_password.encode("utf-8")[:_BCRYPT_MAX_BYTES],
+            hashed_password.encode("ascii"),
+        )
+    except (ValueError, UnicodeEncodeError):
+        return False
+
+
+@lru_cache(maxsize=4)
+def _jwt_keys(secret: str, algorithm: str) -> Tuple[Any, Any]:
+    """
+    (签名 key, 验签 key)：按 (secret, algorithm) 只预处理一次，配置变更后自动重新计算
+
+    只对 RS*/ES* 有实际收益：传入已解析的 key 对象时 PyJWT 直接使用，省去每次完整解析 PEM。
+    HS* 的 key 是 bytes，jwt.encode/decode 内部仍会再走一遍 prepare_key（编码 + PEM 误用检查），
+    缓存对它基本无效，只是让两类算法走同一条代码路径。
+    """
+    algo = get_default_algorithms().get(algorithm)
+    if algo is None:
+        # 未知算法：交给 PyJWT 按原样报错
+        return secret, secret
+    key = algo.prepare_key(secret)
+    # 非对称算法用私钥签名、公钥验签
+    verify_key = key.public_key() if hasattr(key, "public_key") else key
+    return key, verify_key
 
 
 def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta] = None) -> str:
@@ -32,20 +70,35 @@ def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta]
     """
     expire = datetime.utcnow() + (expires_delta or timedelta(hours=settings.jwt_expire_hours))
     to_encode = {**data, "exp": expire, "iat": datetime.utcnow()}
-    return jwt.encode(to_encode, settings.jwt_secret, algorithm=settings.jwt_algorithm)
+    signing_key, _ = _jwt_keys(settings.jwt_secret, settings.jwt_algorithm)
+    return jwt.encode(to_encode, signing_key, algorithm=settings.jwt_algorithm)
 
 
 def decode_access_token(token: str) -> Optional[Dict[str, Any]]:
-    """解码 JWT Token，返回 payload（失败返回 None）"""
+    """解码 JWT Token，返回 payload（失败返回 None；校验通过的结果会短时缓存）"""
+    cached = _token_cache.get(token)
+    if cached is not None:
+        cache_expire_at, payload = cached
+        if cache_expire_at > time.monotonic() and payload.get("exp", 0) > time.time():
+            _token_cache.move_to_end(token)
+            return payload
+        _token_cache.pop(token, None)
+
     try:
-        return jwt.decode(
+        _, verify_key = _jwt_keys(settings.jwt_secret, settings.jwt_algorithm)
+        payload = jwt.decode(
             token, 
-            settings.jwt_secret, 
+            verify_key, 
             algorithms=[settings.jwt_algorithm]
         )
-    except JWTError:
+    except jwt.InvalidTokenError:
         return None
 
+    _token_cache[token] = (time.monotonic() + _TOKEN_CACHE_TTL_SECONDS, payload)
+    if len(_token_cache) > _TOKEN_CACHE_MAX_SIZE:
+        _token_cache.popitem(last=False)
+    return payload
+
 
 # ===== Backward compatible helpers (used by routers/dependencies) =====
 
@@ -0,0 +1,31 @@
+"""
+模型输出 JSON 解析工具
+
+节点（中控 / 图文 / 附件 / 规划）从模型回复里取出 ```json 代码块后统一在这里解析：
+优先 orjson（更快），解析失败再交给标准库兜底。
+"""
+import json
+from typing import Any, Union
+
+# orjson 解析更快；未安装时回退标准库
+try:
+    import orjson
+
+    _fast_loads = orjson.loads
+except ImportError:
+    _fast_loads = None
+
+
+def loads_json(body: Union[str, bytes]) -> Any:
+    """
+    解析 JSON：先走 orjson，失败时回退 json.loads
+
+    orjson 比标准库严格（不接受 NaN / Infinity 等扩展写法），回退保证行为与原来一致；
+    两者都失败时抛出 json.JSONDecodeError（orjson.JSONDecodeError 也是它的子类）。
+    """
+    if _fast_loads is not None:
+        try:
+            return _fast_loads(body)
+        except json.JSONDecodeError:
+            pass
+    return json.loads(body)
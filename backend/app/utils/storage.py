@@ -4,13 +4,30 @@
 import os
 import uuid
 import aiofiles
-from typing import Optional
+from pathlib import Path
+from functools import lru_cache
+from typing import Optional, Union, Any
 
 from app.config import settings
 
+# 流式写入的分块大小（1MB）
+CHUNK_SIZE = 1 << 20
+
+# Linux 下 os.sep 就是 '/'，URL 无需再替换分隔符
+_NEED_SEP_REPLACE = os.sep != "/"
+
+# 已确认存在的目录（避免每次保存都 makedirs 触发 stat 系统调用；目录被删除时 save_file 会重建）
+_ensured_dirs: set[str] = set()
+
+
+@lru_cache(maxsize=8)
+def _storage_prefix(storage_path: str) -> str:
+    """storage 根目录前缀（带结尾分隔符）；按 storage_path 缓存，配置变更后自动重新计算"""
+    return storage_path.rstrip(os.sep) + os.sep
+
 
 async def save_file(
-    content: bytes,
+    content: Union[bytes, Any],
     filename: str,
     subdir: str = "attachments"
 ) -> str:
@@ -18,7 +35,8 @@ async def save_file(
     保存文件到存储目录
     
     Args:
-        content: 文件内容
+        content: 文件内容（bytes），或带 async read(size) 的文件对象（如 UploadFile），
+                 后者按块流式写入，不会把整个文件读进内存
         filename: 原始文件名
         subdir: 子目录（attachments/exports）
     
@@ -26,17 +44,32 @@ async def save_file(
         保存的文件路径
     """
     # 生成唯一文件名
-    ext = os.path.splitext(filename)[1]
+    ext = Path(filename).suffix
     unique_name = f"{uuid.uuid4()}{ext}"
     
     # 确保目录存在
+    # 用 os.path.join 而不是 Path：保留 storage_path 原样的前缀（如 "./storage"），get_file_url 按它匹配
     dir_path = os.path.join(settings.storage_path, subdir)
-    os.makedirs(dir_path, exist_ok=True)
+    if dir_path not in _ensured_dirs:
+        ensure_dir(dir_path)
+        _ensured_dirs.add(dir_path)
     
     # 保存文件
     filepath = os.path.join(dir_path, unique_name)
-    async with aiofiles.open(filepath, 'wb') as f:
-        await f.write(content)
+    try:
+        f = await aiofiles.open(filepath, 'wb')
+    except FileNotFoundError:
+        # 目录在进程运行期间被删除（如手工清理 storage）：重建后重试一次
+        ensure_dir(dir_path)
+        f = await aiofiles.open(filepath, 'wb')
+    try:
+        if isinstance(content, (bytes, bytearray, memoryview)):
+            await f.write(content)
+        else:
+            while chunk := await content.read(CHUNK_SIZE):
+                await f.write(chunk)
+    finally:
+        await f.close()
     
     return filepath
 
@@ -52,13 +85,14 @@ def get_file_url(filepath: str) -> str:
         可访问的 URL
     """
     # 转换为相对于 storage 的路径
-    if filepath.startswith(settings.storage_path):
-        relative = filepath[len(settings.storage_path):].lstrip(os.sep)
-        return f"/storage/{relative.replace(os.sep, '/')}"
+    prefix = _storage_prefix(settings.storage_path)
+    if filepath.startswith(prefix):
+        relative = filepath[len(prefix):]
+        return "/storage/" + (relative.replace(os.sep, "/") if _NEED_SEP_REPLACE else relative)
     return filepath
 
 
-def ensure_dir(path: str):
-    """确保目录存在"""
-    os.makedirs(path, exist_ok=True)
+def ensure_dir(path: Union[str, Path]):
+    """确保目录存在（单次 mkdir；已存在时不报错）"""
+    Path(path).mkdir(parents=True, exist_ok=True)
 
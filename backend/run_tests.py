@@ -9,10 +9,18 @@ Usage:
     python run_tests.py network      # Run network connectivity tests
     python run_tests.py integration  # Run integration tests
     python run_tests.py quick        # Run quick tests (skip slow/network)
+
+Local suites run in parallel across CPU cores (pytest-xdist, "-n auto");
+"--dist=loadfile" keeps every test in a file on the same worker, since tests
+in one file share app/DB fixtures. Network/integration suites stay serial to
+avoid DashScope rate limits.
 """
 import sys
 import subprocess
 
+# pytest-xdist: spread test files over all CPU cores (one file per worker)
+PARALLEL = ["-n", "auto", "--dist=loadfile"]
+
 
 def run_pytest(args: list[str]):
     """Run pytest with given arguments"""
@@ -26,7 +34,7 @@ def run_pytest(args: list[str]):
 def main():
     if len(sys.argv) < 2:
         # Run all tests
-        return run_pytest(["-v", "--tb=short"])
+        return run_pytest(["-v", "--tb=short"] + PARALLEL)
     
     test_type = sys.argv[1].lower()
     
@@ -38,7 +46,7 @@ def main():
             "tests/test_nodes.py",
             "tests/test_model_client.py",
             "-m", "not integration"
-        ])
+        ] + PARALLEL)
     
     elif test_type == "api":
         # API endpoint tests
@@ -49,7 +57,7 @@ def main():
             "tests/test_workflow.py",
             "tests/test_attachments.py",
             "tests/test_export.py",
-        ])
+        ] + PARALLEL)
     
     elif test_type == "network":
         # Network connectivity tests (requires .env)
@@ -70,8 +78,8 @@ def main():
         return run_pytest([
             "-v",
             "--ignore=tests/test_network.py",
-            "-m", "not slow",
-        ])
+            "-m", "not slow and not network",
+        ] + PARALLEL)
     
     elif test_type == "coverage":
         # Run with coverage report
@@ -80,7 +88,7 @@ def main():
             "--cov=app",
             "--cov-report=term-missing",
             "--cov-report=html",
-        ])
+        ] + PARALLEL)
     
     else:
         print(f"Unknown test type: {test_type}")
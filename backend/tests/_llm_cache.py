@@ -0,0 +1,79 @@
+"""
+LLM 探测响应缓存（仅测试使用）
+
+冒烟模式（环境变量 LLM_CACHE=1）下，网络测试对 Generation.call 的请求按
+(model, messages, 其余参数) 的 blake2b 指纹缓存到 pytest 的 cache 目录（.pytest_cache），
+命中时直接返回上次的回复，不再请求 DashScope。
+
+默认关闭：模型可用性测试的本意是验证真实连通性。
+"""
+import os
+import json
+import hashlib
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Optional
+
+CACHE_ENV = "LLM_CACHE"
+CACHE_PREFIX = "llm"
+
+# 不参与指纹的参数（密钥不能落盘，也不影响回复）
+_IGNORED_KEYS = frozenset({"api_key"})
+
+
+def enabled() -> bool:
+    """是否开启冒烟模式缓存"""
+    return os.environ.get(CACHE_ENV, "").lower() in ("1", "true", "yes")
+
+
+def request_key(call_kwargs: Dict[str, Any]) -> str:
+    """请求指纹：参数排序后序列化，再取 blake2b"""
+    payload = {k: v for k, v in call_kwargs.items() if k not in _IGNORED_KEYS}
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    return f"{CACHE_PREFIX}/{hashlib.blake2b(raw, digest_size=16).hexdigest()}"
+
+
+def dump_response(response: Any) -> Optional[Dict[str, Any]]:
+    """把成功的 SDK 响应转成可 JSON 序列化的 dict（失败响应不缓存）"""
+    if getattr(response, "status_code", None) != 200:
+        return None
+    message = response.output.choices[0].message
+    return {
+        "content": getattr(message, "content", "") or "",
+        "reasoning_content": getattr(message, "reasoning_content", "") or "",
+    }
+
+
+def load_response(data: Dict[str, Any]) -> SimpleNamespace:
+    """还原成与 SDK 响应同形的对象（output.choices[0].message）"""
+    message = SimpleNamespace(content=data["content"], reasoning_content=data["reasoning_content"])
+    return SimpleNamespace(
+        status_code=200,
+        code="",
+        message="",
+        usage=None,
+        output=SimpleNamespace(choices=[SimpleNamespace(message=message)]),
+    )
+
+
+def cached_call(upstream: Callable[..., Any], cache) -> Callable[..., Any]:
+    """
+    包装 Generation.call：先查缓存，未命中再请求上游并写回（cache 为 pytest config.cache）
+
+    cache 为 None（-p no:cacheprovider 时没有 config.cache）时不缓存，直接返回上游。
+    """
+    if cache is None:
+        return upstream
+
+    def call(**call_kwargs):
+        if call_kwargs.get("stream"):
+            return upstream(**call_kwargs)
+        key = request_key(call_kwargs)
+        data = cache.get(key, None)
+        if data is not None:
+            return load_response(data)
+        response = upstream(**call_kwargs)
+        data = dump_response(response)
+        if data is not None:
+            cache.set(key, data)
+        return response
+    return call
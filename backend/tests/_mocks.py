@@ -0,0 +1,44 @@
+"""
+DashScope SDK 响应替身（仅测试使用）
+
+test_model_client / test_nodes 共用的 output.choices[0].message 响应结构：
+slots dataclass 构造，比 MagicMock 轻，拼错属性名时直接报错。
+"""
+from dataclasses import dataclass
+from typing import Any
+
+
+@dataclass(slots=True)
+class Message:
+    content: Any = ""
+    reasoning_content: str = ""
+
+
+@dataclass(slots=True)
+class Choice:
+    message: Message
+
+
+@dataclass(slots=True)
+class Output:
+    choices: list
+
+
+@dataclass(slots=True)
+class Response:
+    output: Output
+    status_code: int = 200
+    code: str = ""
+    message: str = ""
+    usage: Any = None
+
+
+def make_response(content: Any = "", reasoning_content: str = "", status_code: int = 200) -> Response:
+    """构造 DashScope SDK 响应（非 200 时带错误码 / 错误信息）"""
+    ok = status_code == 200
+    return Response(
+        output=Output(choices=[Choice(message=Message(content, reasoning_content))]),
+        status_code=status_code,
+        code="" if ok else "Error",
+        message="" if ok else "测试错误",
+    )
@@ -3,83 +3,231 @@ Pytest fixtures and configuration
 """
 import os
 import sys
+import shutil
 import asyncio
-from typing import AsyncGenerator, Generator
+import tempfile
+from pathlib import Path
+from uuid import uuid4
+from typing import AsyncGenerator, Optional
 
 import pytest
 import pytest_asyncio
+import httpx
 from httpx import AsyncClient, ASGITransport
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 
+try:
+    import uvloop
+except ImportError:  # Windows / not installed: fall back to the default asyncio loop
+    uvloop = None
+else:
+    # Every loop pytest-asyncio creates for the session is a uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
 # Add app to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.main import app
 from app.database import Base, get_db
+from app.models.user import User
 from app.config import settings
+from tests import _llm_cache
 
+# The configured application database, captured before test_engine points settings at the test DB
+APP_DATABASE_URL = settings.database_url
 
-@pytest.fixture(scope="session")
-def event_loop() -> Generator:
-    """Create event loop for async tests"""
-    loop = asyncio.get_event_loop_policy().new_event_loop()
-    yield loop
-    loop.close()
+# tmpfs (Linux) for the test database; falls back to the pytest tmp dir elsewhere
+RAM_DIR = "/dev/shm"
 
+# bcrypt's minimum cost factor (2^4 iterations)
+BCRYPT_TEST_ROUNDS = 4
 
-@pytest_asyncio.fixture(scope="function")
-async def test_db(tmp_path) -> AsyncGenerator[AsyncSession, None]:
-    """Create test database and session"""
+
+def _set_test_sqlite_pragmas(dbapi_connection, _):
+    """SQLite pragmas for every engine opened on the test database
+
+    WAL lets background-task connections read while the test session writes;
+    durability is irrelevant for a throwaway test database.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=OFF")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _fast_password_hashing():
+    """Use bcrypt's minimum cost factor for the test session
+
+    Hashes stay real bcrypt (verify / "$2b$" checks still hold) but cost ~1ms
+    instead of ~250ms at the production default of 12 rounds.
+    """
+    old_rounds = settings.bcrypt_rounds
+    settings.bcrypt_rounds = BCRYPT_TEST_ROUNDS
+    yield
+    settings.bcrypt_rounds = old_rounds
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _llm_smoke_cache(request):
+    """Smoke mode (LLM_CACHE=1): replay cached model probe replies instead of calling DashScope
+
+    Session-scoped so every live-probe module shares one wrapper; a no-op unless LLM_CACHE is set
+    and pytest's cache plugin is active (it is missing under -p no:cacheprovider).
+    """
+    cache = getattr(request.config, "cache", None)
+    if not _llm_cache.enabled() or cache is None:
+        yield
+        return
+    import dashscope
+    
+    mp = pytest.MonkeyPatch()
+    mp.setattr(
+        dashscope.Generation, "call",
+        _llm_cache.cached_call(dashscope.Generation.call, cache),
+    )
+    yield
+    mp.undo()
+
+
+@pytest_asyncio.fixture(scope="session")
+async def test_engine(tmp_path_factory, worker_id: str) -> AsyncGenerator[AsyncEngine, None]:
+    """Create the test database engine once per session (schema created once)"""
     # Use file-based SQLite so background tasks / new connections can see the same DB.
     # In-memory SQLite is per-connection and will break background tasks.
-    db_file = tmp_path / "test.db"
+    # Under pytest-xdist each worker gets its own file ("master" when not distributed).
+    # Prefer a RAM-backed tmpfs so writes never touch the disk.
+    if os.path.isdir(RAM_DIR) and os.access(RAM_DIR, os.W_OK):
+        db_dir = Path(tempfile.mkdtemp(prefix=f"xuanshu-test-{worker_id}-", dir=RAM_DIR))
+    else:
+        db_dir = tmp_path_factory.mktemp(f"db_{worker_id}")
+    db_file = db_dir / "test.db"
     test_db_url = f"sqlite+aiosqlite:///{db_file.as_posix()}"
 
     old_db_url = settings.database_url
     settings.database_url = test_db_url
 
     engine = create_async_engine(test_db_url, echo=False)
-    
+    event.listen(engine.sync_engine, "connect", _set_test_sqlite_pragmas)
+
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
-    
-    async_session = sessionmaker(
-        engine, class_=AsyncSession, expire_on_commit=False
-    )
-    
-    async with async_session() as session:
-        yield session
-    
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.drop_all)
-    
+
+    yield engine
+
     await engine.dispose()
     settings.database_url = old_db_url
+    if db_dir.parent == Path(RAM_DIR):
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+
+SAMPLE_DOC_TITLE = "Shared Test Document"
+
+# Shared pool/timeout settings for the test HTTP clients
+CLIENT_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=100)
+CLIENT_TIMEOUT = httpx.Timeout(10.0)
+
+
+def _make_client(transport: ASGITransport, headers: Optional[dict] = None) -> AsyncClient:
+    """Build a pooled test client on the shared transport"""
+    return AsyncClient(
+        transport=transport,
+        base_url="http://test",
+        headers=headers,
+        limits=CLIENT_LIMITS,
+        timeout=CLIENT_TIMEOUT,
+    )
+
+
+@pytest_asyncio.fixture(scope="session")
+async def db_engine() -> AsyncGenerator[AsyncEngine, None]:
+    """Pooled engine on the configured application database (connectivity probe only)
+
+    No pragmas or schema changes: the probe must leave the real database as it found it.
+    """
+    engine = create_async_engine(
+        APP_DATABASE_URL,
+        echo=False,
+        pool_size=5,
+        max_overflow=10,
+        pool_pre_ping=True,
+    )
+    yield engine
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture(scope="session")
+async def http_client() -> AsyncGenerator[httpx.AsyncClient, None]:
+    """Real-network HTTP client shared by the network tests (one TCP/TLS pool per session)"""
+    async with httpx.AsyncClient(limits=CLIENT_LIMITS, timeout=CLIENT_TIMEOUT) as ac:
+        yield ac
+
+
+@pytest.fixture(scope="session")
+def test_session_factory(test_engine: AsyncEngine) -> sessionmaker:
+    """Session factory bound to the test database"""
+    return sessionmaker(test_engine, class_=AsyncSession, expire_on_commit=False)
 
 
 @pytest_asyncio.fixture(scope="function")
-async def client(test_db: AsyncSession) -> AsyncGenerator[AsyncClient, None]:
-    """Create test HTTP client with test database"""
+async def test_db(test_session_factory: sessionmaker) -> AsyncGenerator[AsyncSession, None]:
+    """Create test database session"""
+    async with test_session_factory() as session:
+        yield session
+
+
+@pytest_asyncio.fixture(scope="session")
+async def asgi_transport(test_session_factory: sessionmaker) -> AsyncGenerator[ASGITransport, None]:
+    """One ASGI transport (app + test DB override) shared by every test client"""
     
     async def override_get_db():
-        yield test_db
+        # Like the real get_db: one DB session per request
+        async with test_session_factory() as session:
+            yield session
     
     app.dependency_overrides[get_db] = override_get_db
     
-    transport = ASGITransport(app=app)
-    async with AsyncClient(transport=transport, base_url="http://test") as ac:
-        yield ac
+    yield ASGITransport(app=app)
     
     app.dependency_overrides.clear()
 
 
-@pytest_asyncio.fixture(scope="function")
-async def auth_client(client: AsyncClient) -> AsyncGenerator[tuple[AsyncClient, dict], None]:
-    """Create authenticated test client"""
-    # Register a test user
+@pytest_asyncio.fixture(scope="session")
+async def client(asgi_transport: ASGITransport) -> AsyncGenerator[AsyncClient, None]:
+    """Create one unauthenticated test HTTP client for the whole session"""
+    # Created and closed on the session event loop, so it is never reused across loops
+    async with _make_client(asgi_transport) as ac:
+        yield ac
+
+
+@pytest.fixture(autouse=True)
+def _shared_client_stays_anonymous(request):
+    """Fail a test that leaves credentials on the session-wide `client`
+
+    Pass per-request headers=... (or use auth_client / two_users) instead of
+    mutating client.headers, otherwise the token leaks into later tests.
+    """
+    if "client" not in request.fixturenames:
+        yield
+        return
+    shared = request.getfixturevalue("client")
+    yield
+    assert "Authorization" not in shared.headers, (
+        f"{request.node.nodeid} left an Authorization header on the shared client"
+    )
+
+
+@pytest_asyncio.fixture(scope="session")
+async def auth_client(
+    client: AsyncClient, asgi_transport: ASGITransport
+) -> AsyncGenerator[tuple[AsyncClient, dict], None]:
+    """Create one authenticated test client for the whole session"""
+    # Register a throwaway user; the name is unique because the DB lives for the session
     register_data = {
-        "username": "testuser",
+        "username": f"testuser_{uuid4().hex[:8]}",
         "password": "testpass123"
     }
     response = await client.post("/api/auth/register", json=register_data)
@@ -88,10 +236,55 @@ async def auth_client(client: AsyncClient) -> AsyncGenerator[tuple[AsyncClient,
     auth_data = response.json()
     token = auth_data["token"]
     
-    # Set authorization header
-    client.headers["Authorization"] = f"Bearer {token}"
+    # Separate client so the shared unauthenticated `client` never carries a token
+    async with _make_client(asgi_transport, {"Authorization": f"Bearer {token}"}) as ac:
+        yield ac, auth_data
+
+
+@pytest_asyncio.fixture(scope="session")
+async def two_users(client: AsyncClient) -> tuple[dict, dict]:
+    """Two registered users for the whole session (sharing / login tests)
+
+    Each dict is the register response plus the plain-text "password".
+    """
+    suffix = uuid4().hex[:6]
+    users = []
+    for role in ("sharer", "recipient"):
+        register_data = {"username": f"{role}_{suffix}", "password": "password123"}
+        response = await client.post("/api/auth/register", json=register_data)
+        assert response.status_code == 200
+        users.append({**response.json(), "password": register_data["password"]})
+    return users[0], users[1]
+
+
+@pytest_asyncio.fixture(scope="module")
+async def sample_doc(auth_client: tuple[AsyncClient, dict]) -> str:
+    """Shared document for read-only tests in a module (do not mutate it)"""
+    client, _ = auth_client
+    response = await client.post("/api/docs", json={"title": SAMPLE_DOC_TITLE})
+    assert response.status_code == 200
+    return response.json()["doc_id"]
+
+
+@pytest_asyncio.fixture(scope="module")
+async def sample_doc_with_content(auth_client: tuple[AsyncClient, dict]) -> str:
+    """Shared document with Markdown content, e.g. for export tests"""
+    client, _ = auth_client
+    response = await client.post("/api/docs", json={"title": SAMPLE_DOC_TITLE})
+    assert response.status_code == 200
+    doc_id = response.json()["doc_id"]
     
-    yield client, auth_data
+    response = await client.put(f"/api/docs/{doc_id}", json={
+        "content_md": "# Test Document\n\nThis is test content."
+    })
+    assert response.status_code == 200
+    return doc_id
+
+
+@pytest.fixture(scope="session")
+def fake_user() -> User:
+    """Transient user for calling route handlers directly (never persisted)"""
+    return User(id=str(uuid4()), username="direct_call_user", password_hash="")
 
 
 @pytest.fixture
@@ -2,8 +2,42 @@
 Attachment API tests
 """
 import io
+import asyncio
 import pytest
+import pytest_asyncio
+from fastapi import HTTPException
 from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.user import User
+from app.routers.attachments import get_attachment
+
+# Immutable upload payloads shared by all tests (BytesIO is created per request)
+TXT_BYTES = b"This is a test file content"
+TXT_CT = "text/plain"
+
+
+async def make_doc_with_attachments(client: AsyncClient, n: int = 1) -> tuple[str, list[str]]:
+    """Create a document and upload n text attachments to it concurrently"""
+    doc_response = await client.post("/api/docs", json={"title": "Attachment Test"})
+    doc_id = doc_response.json()["doc_id"]
+    
+    uploads = await asyncio.gather(*[
+        client.post(
+            "/api/attachments",
+            files={"file": (f"test{i}.txt", io.BytesIO(TXT_BYTES), TXT_CT)},
+            data={"doc_id": doc_id},
+        )
+        for i in range(n)
+    ])
+    return doc_id, [u.json()["attachment_id"] for u in uploads]
+
+
+@pytest_asyncio.fixture(scope="module")
+async def doc_with_three_attachments(auth_client: tuple[AsyncClient, dict]) -> tuple[str, list[str]]:
+    """Document with three attachments, created once per module (read-only)"""
+    client, _ = auth_client
+    return await make_doc_with_attachments(client, 3)
 
 
 class TestAttachmentAPI:
@@ -19,8 +53,7 @@ class TestAttachmentAPI:
         doc_id = doc_response.json()["doc_id"]
         
         # Create a fake file
-        file_content = b"This is a test file content"
-        files = {"file": ("test.txt", io.BytesIO(file_content), "text/plain")}
+        files = {"file": ("test.txt", io.BytesIO(TXT_BYTES), TXT_CT)}
         data = {"doc_id": doc_id}
         
         response = await client.post("/api/attachments", files=files, data=data)
@@ -31,18 +64,13 @@ class TestAttachmentAPI:
         assert result["filename"] == "test.txt"
     
     @pytest.mark.asyncio
-    async def test_get_attachment(self, auth_client: tuple[AsyncClient, dict]):
+    async def test_get_attachment(
+        self, auth_client: tuple[AsyncClient, dict], doc_with_three_attachments: tuple[str, list[str]]
+    ):
         """Test getting attachment info"""
         client, _ = auth_client
-        
-        # Create doc and upload attachment
-        doc_response = await client.post("/api/docs", json={"title": "Get Attachment Test"})
-        doc_id = doc_response.json()["doc_id"]
-        
-        file_content = b"Test content"
-        files = {"file": ("test.txt", io.BytesIO(file_content), "text/plain")}
-        upload_response = await client.post("/api/attachments", files=files, data={"doc_id": doc_id})
-        attachment_id = upload_response.json()["attachment_id"]
+        _, attachment_ids = doc_with_three_attachments
+        attachment_id = attachment_ids[0]
         
         # Get attachment info
         response = await client.get(f"/api/attachments/{attachment_id}")
@@ -50,21 +78,15 @@ class TestAttachmentAPI:
         assert response.status_code == 200
         data = response.json()
         assert data["attachment_id"] == attachment_id
-        assert data["filename"] == "test.txt"
+        assert data["filename"] == "test0.txt"
     
     @pytest.mark.asyncio
-    async def test_get_document_attachments(self, auth_client: tuple[AsyncClient, dict]):
+    async def test_get_document_attachments(
+        self, auth_client: tuple[AsyncClient, dict], doc_with_three_attachments: tuple[str, list[str]]
+    ):
         """Test getting all attachments for a document"""
         client, _ = auth_client
-        
-        # Create doc
-        doc_response = await client.post("/api/docs", json={"title": "List Attachments Test"})
-        doc_id = doc_response.json()["doc_id"]
-        
-        # Upload multiple attachments
-        for i in range(3):
-            files = {"file": (f"test{i}.txt", io.BytesIO(f"Content {i}".encode()), "text/plain")}
-            await client.post("/api/attachments", files=files, data={"doc_id": doc_id})
+        doc_id, _ = doc_with_three_attachments
         
         # Get all attachments
         response = await client.get(f"/api/attachments/doc/{doc_id}")
@@ -79,18 +101,17 @@ class TestAttachmentAPI:
         """Test uploading to nonexistent document"""
         client, _ = auth_client
         
-        files = {"file": ("test.txt", io.BytesIO(b"content"), "text/plain")}
+        files = {"file": ("test.txt", io.BytesIO(TXT_BYTES), TXT_CT)}
         response = await client.post("/api/attachments", files=files, data={"doc_id": "nonexistent"})
         
         assert response.status_code == 404
     
     @pytest.mark.asyncio
-    async def test_get_nonexistent_attachment(self, auth_client: tuple[AsyncClient, dict]):
-        """Test getting nonexistent attachment"""
-        client, _ = auth_client
+    async def test_get_nonexistent_attachment(self, test_db: AsyncSession, fake_user: User):
+        """Test getting nonexistent attachment (handler called directly)"""
+        with pytest.raises(HTTPException) as exc:
+            await get_attachment("nonexistent-id", user=fake_user, db=test_db)
         
-        response = await client.get("/api/attachments/nonexistent-id")
-        
-        assert response.status_code == 404
+        assert exc.value.status_code == 404
 
 
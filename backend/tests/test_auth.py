@@ -2,30 +2,37 @@
 Authentication API tests
 """
 import pytest
+from uuid import uuid4
 from httpx import AsyncClient
 
 
+def _unique(prefix: str) -> str:
+    """Unique username: the test DB is shared by the whole session"""
+    return f"{prefix}_{uuid4().hex[:8]}"
+
+
 class TestAuthAPI:
     """Test authentication endpoints"""
     
     @pytest.mark.asyncio
     async def test_register_success(self, client: AsyncClient):
         """Test successful user registration"""
+        username = _unique("newuser")
         response = await client.post("/api/auth/register", json={
-            "username": "newuser",
+            "username": username,
             "password": "password123"
         })
         
         assert response.status_code == 200
         data = response.json()
         assert "user_id" in data
-        assert data["username"] == "newuser"
+        assert data["username"] == username
         assert "token" in data
     
     @pytest.mark.asyncio
     async def test_register_duplicate_username(self, client: AsyncClient):
         """Test registration with duplicate username"""
-        user_data = {"username": "duplicateuser", "password": "password123"}
+        user_data = {"username": _unique("duplicateuser"), "password": "password123"}
         
         # First registration
         response = await client.post("/api/auth/register", json=user_data)
@@ -38,37 +45,27 @@ class TestAuthAPI:
         assert ("already exists" in detail.lower()) or ("已存在" in detail)
     
     @pytest.mark.asyncio
-    async def test_login_success(self, client: AsyncClient):
+    async def test_login_success(self, client: AsyncClient, two_users: tuple[dict, dict]):
         """Test successful login"""
-        # Register first
-        await client.post("/api/auth/register", json={
-            "username": "loginuser",
-            "password": "password123"
-        })
+        user, _ = two_users
         
-        # Login
         response = await client.post("/api/auth/login", json={
-            "username": "loginuser",
-            "password": "password123"
+            "username": user["username"],
+            "password": user["password"]
         })
         
         assert response.status_code == 200
         data = response.json()
         assert "token" in data
-        assert data["username"] == "loginuser"
+        assert data["username"] == user["username"]
     
     @pytest.mark.asyncio
-    async def test_login_wrong_password(self, client: AsyncClient):
+    async def test_login_wrong_password(self, client: AsyncClient, two_users: tuple[dict, dict]):
         """Test login with wrong password"""
-        # Register first
-        await client.post("/api/auth/register", json={
-            "username": "wrongpassuser",
-            "password": "correctpass"
-        })
+        user, _ = two_users
         
-        # Login with wrong password
         response = await client.post("/api/auth/login", json={
-            "username": "wrongpassuser",
+            "username": user["username"],
             "password": "wrongpass"
         })
         
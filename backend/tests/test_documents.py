@@ -1,8 +1,14 @@
 """
 Document API tests
 """
+import asyncio
 import pytest
+from fastapi import HTTPException
 from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.user import User
+from app.routers.documents import get_document
 
 
 class TestDocumentAPI:
@@ -38,8 +44,10 @@ class TestDocumentAPI:
         client, _ = auth_client
         
         # Create some documents
-        await client.post("/api/docs", json={"title": "Doc 1"})
-        await client.post("/api/docs", json={"title": "Doc 2"})
+        await asyncio.gather(
+            client.post("/api/docs", json={"title": "Doc 1"}),
+            client.post("/api/docs", json={"title": "Doc 2"}),
+        )
         
         # Get my documents
         response = await client.get("/api/docs/my")
@@ -50,29 +58,25 @@ class TestDocumentAPI:
         assert len(data["docs"]) >= 2
     
     @pytest.mark.asyncio
-    async def test_get_document_detail(self, auth_client: tuple[AsyncClient, dict]):
+    async def test_get_document_detail(self, auth_client: tuple[AsyncClient, dict], sample_doc: str):
         """Test getting document details"""
         client, _ = auth_client
         
-        # Create a document
-        create_response = await client.post("/api/docs", json={"title": "Detail Test"})
-        doc_id = create_response.json()["doc_id"]
-        
         # Get details
-        response = await client.get(f"/api/docs/{doc_id}")
+        response = await client.get(f"/api/docs/{sample_doc}")
         
         assert response.status_code == 200
         data = response.json()
-        assert data["title"] == "Detail Test"
+        assert data["doc_id"] == sample_doc
+        assert data["title"] == "Shared Test Document"  # conftest.SAMPLE_DOC_TITLE
     
     @pytest.mark.asyncio
-    async def test_get_nonexistent_document(self, auth_client: tuple[AsyncClient, dict]):
-        """Test getting nonexistent document"""
-        client, _ = auth_client
-        
-        response = await client.get("/api/docs/nonexistent-id")
+    async def test_get_nonexistent_document(self, test_db: AsyncSession, fake_user: User):
+        """Test getting nonexistent document (handler called directly)"""
+        with pytest.raises(HTTPException) as exc:
+            await get_document("nonexistent-id", user=fake_user, db=test_db)
         
-        assert response.status_code == 404
+        assert exc.value.status_code == 404
     
     @pytest.mark.asyncio
     async def test_update_document(self, auth_client: tuple[AsyncClient, dict]):
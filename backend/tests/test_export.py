@@ -2,28 +2,42 @@
 Export API tests
 """
 import pytest
+from fastapi import HTTPException
 from httpx import AsyncClient
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.export import Export
+from app.models.user import User
+from app.routers.export import get_export_status
+
+
+@pytest.fixture
+def fast_export_worker(monkeypatch, test_session_factory):
+    """Replace the DOCX background worker with one that only marks the export completed
+
+    DOCX rendering itself is covered by the export service; these tests only check the API shape.
+    """
+    async def _mark_completed(export_id, *args, **kwargs):
+        async with test_session_factory() as db:
+            await db.execute(update(Export).where(Export.id == export_id).values(status="completed"))
+            await db.commit()
+    
+    monkeypatch.setattr("app.routers.export.run_export_task", _mark_completed)
 
 
 class TestExportAPI:
     """Test export endpoints"""
     
     @pytest.mark.asyncio
-    async def test_create_export_task(self, auth_client: tuple[AsyncClient, dict]):
+    async def test_create_export_task(
+        self, auth_client: tuple[AsyncClient, dict], sample_doc_with_content: str, fast_export_worker
+    ):
         """Test creating an export task"""
         client, _ = auth_client
         
-        # Create a document with content
-        doc_response = await client.post("/api/docs", json={"title": "Export Test"})
-        doc_id = doc_response.json()["doc_id"]
-        
-        # Add some content
-        await client.put(f"/api/docs/{doc_id}", json={
-            "content_md": "# Test Document\n\nThis is test content."
-        })
-        
         # Create export task
-        response = await client.post(f"/api/exports/docs/{doc_id}/docx")
+        response = await client.post(f"/api/exports/docs/{sample_doc_with_content}/docx")
         
         assert response.status_code == 200
         data = response.json()
@@ -47,20 +61,14 @@ class TestExportAPI:
         assert ("empty" in detail.lower()) or ("为空" in detail)
     
     @pytest.mark.asyncio
-    async def test_get_export_status(self, auth_client: tuple[AsyncClient, dict]):
+    async def test_get_export_status(
+        self, auth_client: tuple[AsyncClient, dict], sample_doc_with_content: str, fast_export_worker
+    ):
         """Test getting export status"""
         client, _ = auth_client
         
-        # Create document with content
-        doc_response = await client.post("/api/docs", json={"title": "Status Test"})
-        doc_id = doc_response.json()["doc_id"]
-        
-        await client.put(f"/api/docs/{doc_id}", json={
-            "content_md": "# Test\n\nContent here."
-        })
-        
         # Create export
-        export_response = await client.post(f"/api/exports/docs/{doc_id}/docx")
+        export_response = await client.post(f"/api/exports/docs/{sample_doc_with_content}/docx")
         export_id = export_response.json()["export_id"]
         
         # Get status
@@ -69,7 +77,8 @@ class TestExportAPI:
         assert response.status_code == 200
         data = response.json()
         assert data["export_id"] == export_id
-        assert "status" in data
+        # The ASGI transport runs background tasks before returning the response
+        assert data["status"] == "completed"
     
     @pytest.mark.asyncio
     async def test_export_nonexistent_document(self, auth_client: tuple[AsyncClient, dict]):
@@ -81,12 +90,11 @@ class TestExportAPI:
         assert response.status_code == 404
     
     @pytest.mark.asyncio
-    async def test_get_nonexistent_export(self, auth_client: tuple[AsyncClient, dict]):
-        """Test getting nonexistent export"""
-        client, _ = auth_client
-        
-        response = await client.get("/api/exports/nonexistent-export-id")
+    async def test_get_nonexistent_export(self, test_db: AsyncSession, fake_user: User):
+        """Test getting nonexistent export (handler called directly)"""
+        with pytest.raises(HTTPException) as exc:
+            await get_export_status("nonexistent-export-id", user=fake_user, db=test_db)
         
-        assert response.status_code == 404
+        assert exc.value.status_code == 404
 
 
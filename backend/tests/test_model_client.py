@@ -1,57 +1,197 @@
 """
 DashScope 模型客户端单元测试
 """
+import importlib
+import json
+import asyncio
+import threading
+import httpx
 import pytest
-from unittest.mock import AsyncMock, patch, MagicMock
+from contextlib import aclosing
+from unittest.mock import MagicMock
 
+from app.services.model_client import (
+    DashScopeClient, model_client, call_controller, call_writer, call_diagram,
+)
+from tests._mocks import make_response
 
-class MockResponse:
-    """模拟 DashScope SDK 响应"""
-    def __init__(self, status_code=200, content="测试回复", reasoning_content=""):
-        self.status_code = status_code
-        self.code = "" if status_code == 200 else "Error"
-        self.message = "" if status_code == 200 else "测试错误"
-        
-        # 构造 output.choices[0].message 结构
-        mock_message = MagicMock()
-        mock_message.content = content
-        mock_message.reasoning_content = reasoning_content
-        
-        mock_choice = MagicMock()
-        mock_choice.message = mock_message
-        
-        mock_output = MagicMock()
-        mock_output.choices = [mock_choice]
-        
-        self.output = mock_output
+
+@pytest.fixture(autouse=True)
+def mock_generation(monkeypatch) -> MagicMock:
+    """替换 Generation.call，测试通过 return_value / side_effect 设定响应"""
+    mock = MagicMock()
+    monkeypatch.setattr("dashscope.Generation.call", mock)
+    return mock
+
+
+@pytest.fixture(autouse=True)
+def mock_multimodal(monkeypatch) -> MagicMock:
+    """替换 MultiModalConversation.call（图片生成）"""
+    mock = MagicMock()
+    monkeypatch.setattr("dashscope.MultiModalConversation.call", mock)
+    return mock
+
+
+class _FakeSettings:
+    """model_client 读取的配置项替身（__slots__ 防止拼错属性名）"""
+    __slots__ = (
+        "model_controller", "model_writer", "model_diagram",
+        "dashscope_api_key", "dashscope_base_url", "dashscope_http_stream",
+        "model_coalesce_inflight", "debug",
+    )
+
+    def __init__(self, **overrides):
+        self.model_controller = "deepseek-v3.2"
+        self.model_writer = "qwen3-max"
+        self.model_diagram = "qwen3-max"
+        self.dashscope_api_key = "test_key"
+        self.dashscope_base_url = "https://test.com"
+        self.dashscope_http_stream = True
+        self.model_coalesce_inflight = True
+        self.debug = False
+        for name, value in overrides.items():
+            setattr(self, name, value)
+
+
+@pytest.fixture
+def mock_settings(monkeypatch) -> _FakeSettings:
+    """替换 model_client 模块引用的 settings，并给全局 model_client 设置测试 Key"""
+    fake = _FakeSettings()
+    # app.services 包把 model_client 实例导出成了同名属性，字符串路径会解析到实例上，这里直接取模块对象
+    monkeypatch.setattr(importlib.import_module("app.services.model_client"), "settings", fake)
+    monkeypatch.setattr(model_client, "api_key", fake.dashscope_api_key)
+    return fake
 
 
 class TestDashScopeClient:
     """测试 DashScope 客户端"""
     
     @pytest.mark.asyncio
-    async def test_call_success(self):
+    async def test_call_success(self, mock_generation):
         """测试普通对话调用成功"""
-        from app.services.model_client import DashScopeClient
+        mock_response = make_response("你好，我是 AI 助手")
         
-        mock_response = MockResponse(content="你好，我是 AI 助手")
+        mock_generation.return_value = mock_response
+        client = DashScopeClient()
+        client.api_key = "test_key"
         
-        with patch('dashscope.Generation.call', return_value=mock_response):
-            client = DashScopeClient()
-            client.api_key = "test_key"
-            
-            result = await client.call(
-                model="qwen3-max",
-                messages=[{"role": "user", "content": "你好"}]
-            )
-            
-            assert result == "你好，我是 AI 助手"
-    
+        result = await client.call(
+            model="qwen3-max",
+            messages=[{"role": "user", "content": "你好"}]
+        )
+        
+        assert result == "你好，我是 AI 助手"
+
+    @pytest.mark.asyncio
+    async def test_call_with_usage_cached_tokens(self, mock_generation):
+        """测试返回用量并统计上下文缓存命中"""
+        mock_response = make_response("你好")
+        mock_response.usage = {
+            "input_tokens": 1200,
+            "output_tokens": 8,
+            "prompt_tokens_details": {"cached_tokens": 1024},
+        }
+
+        mock_generation.return_value = mock_response
+        client = DashScopeClient()
+        client.api_key = "test_key"
+
+        content, usage = await client.call_with_usage(
+            model="qwen3-max",
+            messages=[{"role": "user", "content": "你好"}]
+        )
+
+        assert content == "你好"
+        assert usage == {"input_tokens": 1200, "output_tokens": 8, "cached_tokens": 1024}
+        assert client._cache_hits == 1
+        assert client._cache_misses == 0
+
+    @pytest.mark.asyncio
+    async def test_call_batch(self, mock_generation):
+        """测试批量调用：一次调用返回 JSON 数组，按编号映射回条目"""
+        mock_response = make_response(
+            '```json\n[{"id": 2, "output": "B"}, {"id": 1, "output": "A"}]\n```'
+        )
+
+        mock_generation.return_value = mock_response
+        client = DashScopeClient()
+        client.api_key = "test_key"
+
+        results = await client.call_batch(
+            model="qwen3-max",
+            shared_system_prompt="你是文档撰写助手",
+            items=[{"section": "简介"}, {"section": "目标"}],
+            item_schema="Markdown 正文",
+        )
+
+        assert results == ["A", "B"]
+        assert mock_generation.call_count == 1
+        user_content = mock_generation.call_args[1]["messages"][-1]["content"]
+        assert user_content.startswith("[1] ")
+        assert "[2] " in user_content
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("wrap", [
+        lambda body: body,
+        lambda body: f"```json\n{body}\n```",
+    ], ids=["bare", "fenced"])
+    async def test_call_batch_outputs_with_code_fences(self, mock_generation, wrap):
+        """测试条目输出里带 ``` 代码块（如 mermaid）时仍按一次批量调用解析"""
+        outputs = ["```mermaid\ngraph TD\nA-->B\n```", "正文\n```python\nprint(1)\n```"]
+        body = json.dumps([{"id": j + 1, "output": o} for j, o in enumerate(outputs)], ensure_ascii=False)
+        mock_generation.return_value = make_response(wrap(body))
+        client = DashScopeClient()
+        client.api_key = "test_key"
+
+        results = await client.call_batch(
+            model="qwen3-max",
+            shared_system_prompt="你是图文助手",
+            items=[{"diagram": "流程"}, {"section": "示例"}],
+            item_schema="mermaid 代码块",
+        )
+
+        assert results == outputs
+        assert mock_generation.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_call_coalesces_identical_requests(self, mock_generation, mock_settings):
+        """测试相同参数的确定性并发请求只调用一次模型，用量只统计一次"""
+        mock_response = make_response("合并结果")
+        mock_response.usage = {"input_tokens": 10, "output_tokens": 2}
+
+        mock_generation.return_value = mock_response
+        client = DashScopeClient()
+        client.api_key = "test_key"
+
+        messages = [{"role": "user", "content": "你好"}]
+        results = await asyncio.gather(
+            client.call(model="qwen3-max", messages=messages, temperature=0),
+            client.call(model="qwen3-max", messages=messages, temperature=0),
+        )
+
+        assert results == ["合并结果", "合并结果"]
+        assert mock_generation.call_count == 1
+        assert client._cache_hits + client._cache_misses == 1
+        assert client._inflight == {}
+
+    @pytest.mark.asyncio
+    async def test_call_does_not_coalesce_sampled_requests(self, mock_generation, mock_settings):
+        """测试 temperature > 0 的并发请求各自调用模型（不共享同一份采样）"""
+        mock_generation.return_value = make_response("采样结果")
+        client = DashScopeClient()
+        client.api_key = "test_key"
+
+        messages = [{"role": "user", "content": "你好"}]
+        await asyncio.gather(
+            client.call(model="qwen3-max", messages=messages, temperature=0.7),
+            client.call(model="qwen3-max", messages=messages, temperature=0.7),
+        )
+
+        assert mock_generation.call_count == 2
+
     @pytest.mark.asyncio
     async def test_call_without_api_key(self):
         """测试无 API Key 时抛出异常"""
-        from app.services.model_client import DashScopeClient
-        
         client = DashScopeClient()
         client.api_key = ""
         
@@ -62,185 +202,244 @@ class TestDashScopeClient:
             )
     
     @pytest.mark.asyncio
-    async def test_call_api_error(self):
+    async def test_call_api_error(self, mock_generation):
         """测试 API 返回错误"""
-        from app.services.model_client import DashScopeClient
-        
-        mock_response = MockResponse(status_code=400)
-        
-        with patch('dashscope.Generation.call', return_value=mock_response):
-            client = DashScopeClient()
-            client.api_key = "test_key"
-            
-            with pytest.raises(Exception, match="API 调用失败"):
-                await client.call(
-                    model="qwen3-max",
-                    messages=[{"role": "user", "content": "你好"}]
-                )
-    
+        mock_response = make_response(status_code=400)
+        
+        mock_generation.return_value = mock_response
+        client = DashScopeClient()
+        client.api_key = "test_key"
+        
+        with pytest.raises(Exception, match="API 调用失败"):
+            await client.call(
+                model="qwen3-max",
+                messages=[{"role": "user", "content": "你好"}]
+            )
+
     @pytest.mark.asyncio
-    async def test_call_with_thinking(self):
+    async def test_call_with_thinking(self, mock_generation):
         """测试带思考模式的调用"""
-        from app.services.model_client import DashScopeClient
+        mock_response = make_response("最终回复", reasoning_content="这是思考过程...")
+        
+        mock_generation.return_value = mock_response
+        client = DashScopeClient()
+        client.api_key = "test_key"
         
-        mock_response = MockResponse(
-            content="最终回复",
-            reasoning_content="这是思考过程..."
+        reasoning, content = await client.call_with_thinking(
+            model="deepseek-v3.2",
+            messages=[{"role": "user", "content": "分析一下"}]
         )
         
-        with patch('dashscope.Generation.call', return_value=mock_response):
-            client = DashScopeClient()
-            client.api_key = "test_key"
-            
-            reasoning, content = await client.call_with_thinking(
-                model="deepseek-v3.2",
-                messages=[{"role": "user", "content": "分析一下"}]
-            )
-            
-            assert reasoning == "这是思考过程..."
-            assert content == "最终回复"
-    
+        assert reasoning == "这是思考过程..."
+        assert content == "最终回复"
+
     @pytest.mark.asyncio
-    async def test_call_with_file(self):
+    async def test_call_with_file(self, mock_generation):
         """测试带文件的调用"""
-        from app.services.model_client import DashScopeClient
-        
-        mock_response = MockResponse(content="文件分析结果")
-        
-        with patch('dashscope.Generation.call', return_value=mock_response) as mock_call:
-            client = DashScopeClient()
-            client.api_key = "test_key"
-            
-            result = await client.call_with_file(
-                model="qwen-long",
-                messages=[{"role": "user", "content": "分析这个文件"}],
-                file_urls=["file_123"]
-            )
-            
-            assert result == "文件分析结果"
-            # 验证消息中包含了文件引用
-            call_args = mock_call.call_args
-            messages = call_args[1]["messages"]
-            assert any("fileid://" in msg.get("content", "") for msg in messages)
+        mock_response = make_response("文件分析结果")
+        
+        mock_generation.return_value = mock_response
+        client = DashScopeClient()
+        client.api_key = "test_key"
+        
+        result = await client.call_with_file(
+            model="qwen-long",
+            messages=[{"role": "user", "content": "分析这个文件"}],
+            file_urls=["file_123"]
+        )
+        
+        assert result == "文件分析结果"
+        # 验证消息中包含了文件引用
+        call_args = mock_generation.call_args
+        messages = call_args[1]["messages"]
+        assert any("fileid://" in msg.get("content", "") for msg in messages)
 
 
-class TestConvenienceFunctions:
-    """测试便捷函数"""
-    
+class TestStreamCall:
+    """测试流式调用（HTTP SSE）"""
+
     @pytest.mark.asyncio
-    async def test_call_controller(self):
-        """测试中控模型调用"""
-        mock_response = MockResponse(
-            content="回复",
-            reasoning_content="思考"
+    async def test_stream_call_sse(self):
+        """测试解析 SSE 增量帧并汇总完整内容"""
+        sse_body = (
+            'id:1\nevent:result\n:HTTP_STATUS/200\n'
+            'data:{"output":{"choices":[{"message":{"role":"assistant","reasoning_content":"想","content":""}}]}}\n\n'
+            'id:2\nevent:result\n:HTTP_STATUS/200\n'
+            'data:{"output":{"choices":[{"message":{"role":"assistant","content":"你好"}}]}}\n\n'
         )
-        
-        with patch('dashscope.Generation.call', return_value=mock_response):
-            with patch('app.services.model_client.settings') as mock_settings:
-                mock_settings.model_controller = "deepseek-v3.2"
-                mock_settings.dashscope_api_key = "test_key"
-                mock_settings.dashscope_base_url = "https://test.com"
-                
-                from app.services.model_client import call_controller
-                
-                reasoning, content = await call_controller(
-                    messages=[{"role": "user", "content": "测试"}]
-                )
-                
-                assert reasoning == "思考"
-                assert content == "回复"
-    
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            assert request.headers["X-DashScope-SSE"] == "enable"
+            return httpx.Response(200, text=sse_body, headers={"Content-Type": "text/event-stream"})
+
+        client = DashScopeClient()
+        client.api_key = "test_key"
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="https://test.com/api/v1") as http:
+            client._http = http
+            events = [ev async for ev in client.stream_call(
+                model="qwen3-max",
+                messages=[{"role": "user", "content": "你好"}]
+            )]
+
+        assert [ev["type"] for ev in events] == ["thinking", "content", "done"]
+        assert events[-1]["reasoning"] == "想"
+        assert events[-1]["content"] == "你好"
+
+    @pytest.mark.asyncio
+    async def test_stream_call_sse_split_chunks(self):
+        """测试 data: 行被拆在多个字节块里（含 \\r\\n 与多字节字符被截断）时仍能完整解析"""
+        frame = 'data:{"output":{"choices":[{"message":{"role":"assistant","content":"你好"}}]}}\r\n\r\n'.encode("utf-8")
+        cut = frame.index("好".encode("utf-8")) + 1  # 截在“好”的 UTF-8 编码中间
+
+        class _ChunkedStream(httpx.AsyncByteStream):
+            async def __aiter__(self):
+                yield frame[:cut]
+                yield frame[cut:]
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, stream=_ChunkedStream())
+
+        client = DashScopeClient()
+        client.api_key = "test_key"
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="https://test.com/api/v1") as http:
+            client._http = http
+            events = [ev async for ev in client.stream_call(
+                model="qwen3-max",
+                messages=[{"role": "user", "content": "你好"}]
+            )]
+
+        assert [ev["type"] for ev in events] == ["content", "done"]
+        assert events[-1]["content"] == "你好"
+
     @pytest.mark.asyncio
-    async def test_call_writer(self):
-        """测试撰写模型调用"""
-        mock_response = MockResponse(content="文档内容")
-        
-        with patch('dashscope.Generation.call', return_value=mock_response):
-            with patch('app.services.model_client.settings') as mock_settings:
-                mock_settings.model_writer = "qwen3-max"
-                mock_settings.dashscope_api_key = "test_key"
-                mock_settings.dashscope_base_url = "https://test.com"
-                
-                from app.services.model_client import call_writer
-                
-                result = await call_writer(
-                    messages=[{"role": "user", "content": "写一篇文章"}]
-                )
-                
-                assert result == "文档内容"
+    async def test_stream_call_sdk_stops_on_early_close(self, mock_generation, mock_settings):
+        """测试 SDK 流式调用被提前关闭后，生产线程不再继续读取 SDK 迭代器"""
+        mock_settings.dashscope_http_stream = False
+        gate = threading.Event()
+        closed = threading.Event()
+        pulled = []
+
+        def responses():
+            try:
+                for i in range(100):
+                    if i:
+                        gate.wait(5)  # 第一帧之后等测试放行，保证线程不会提前读完
+                    pulled.append(i)
+                    yield make_response(f"块{i}")
+            finally:
+                closed.set()
+
+        mock_generation.return_value = responses()
+        client = DashScopeClient()
+        client.api_key = "test_key"
+
+        async with aclosing(client.stream_call(
+            model="qwen3-max",
+            messages=[{"role": "user", "content": "你好"}]
+        )) as stream:
+            async for ev in stream:
+                assert ev == {"type": "content", "content": "块0"}
+                break
+
+        gate.set()
+        assert closed.wait(5)
+        assert pulled == [0, 1]
+
+    @pytest.mark.asyncio
+    async def test_coalesce_deltas(self):
+        """测试按 min_flush_bytes 合并增量事件，首帧立即推送"""
+        async def source():
+            for ev in [
+                {"type": "content", "content": "a"},
+                {"type": "content", "content": "b"},
+                {"type": "content", "content": "c"},
+                {"type": "done", "content": "abc"},
+            ]:
+                yield ev
+
+        events = [ev async for ev in DashScopeClient._coalesce_deltas(source(), 100, 60_000)]
+
+        assert events == [
+            {"type": "content", "content": "a"},
+            {"type": "content", "content": "bc"},
+            {"type": "done", "content": "abc"},
+        ]
+
+    @pytest.mark.asyncio
+    async def test_coalesce_deltas_flushes_on_stall(self):
+        """测试上游停顿超过 max_flush_interval_ms 时不等下一帧，直接推送缓冲"""
+        async def source():
+            yield {"type": "content", "content": "a"}
+            yield {"type": "content", "content": "b"}
+            await asyncio.sleep(0.3)
+            yield {"type": "content", "content": "c"}
+            yield {"type": "done", "content": "abc"}
+
+        events = [ev async for ev in DashScopeClient._coalesce_deltas(source(), 100, 50)]
+
+        assert [ev["content"] for ev in events] == ["a", "b", "c", "abc"]
+
+
+class TestConvenienceFunctions:
+    """测试便捷函数"""
     
     @pytest.mark.asyncio
-    async def test_call_diagram(self):
-        """测试图文模型调用"""
-        mock_response = MockResponse(content="```mermaid\ngraph TD\nA-->B\n```")
-        
-        with patch('dashscope.Generation.call', return_value=mock_response):
-            with patch('app.services.model_client.settings') as mock_settings:
-                mock_settings.model_diagram = "qwen3-max"
-                mock_settings.dashscope_api_key = "test_key"
-                mock_settings.dashscope_base_url = "https://test.com"
-                
-                from app.services.model_client import call_diagram
-                
-                result = await call_diagram(
-                    messages=[{"role": "user", "content": "画个流程图"}]
-                )
-                
-                assert "mermaid" in result
+    @pytest.mark.parametrize("fn, setting_attr, model, response, check", [
+        # 中控模型（带思考）返回 (reasoning, content)
+        (call_controller, "model_controller", "deepseek-v3.2",
+         make_response("回复", reasoning_content="思考"), lambda r: r == ("思考", "回复")),
+        # 撰写模型
+        (call_writer, "model_writer", "qwen3-max",
+         make_response("文档内容"), lambda r: r == "文档内容"),
+        # 图文模型
+        (call_diagram, "model_diagram", "qwen3-max",
+         make_response("```mermaid\ngraph TD\nA-->B\n```"), lambda r: "mermaid" in r),
+    ], ids=["controller", "writer", "diagram"])
+    async def test_convenience_call(self, mock_generation, mock_settings, fn, setting_attr, model, response, check):
+        """测试中控 / 撰写 / 图文便捷函数"""
+        mock_generation.return_value = response
+        setattr(mock_settings, setting_attr, model)
+        
+        result = await fn(messages=[{"role": "user", "content": "测试"}])
+        
+        assert check(result)
+        assert mock_generation.call_args[1]["model"] == model
 
 
 class TestImageGeneration:
     """测试图片生成"""
     
     @pytest.mark.asyncio
-    async def test_generate_image_success(self):
+    async def test_generate_image_success(self, mock_multimodal):
         """测试图片生成成功"""
-        from app.services.model_client import DashScopeClient
-        
         # 模拟图片生成响应
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        
-        mock_content = [{"image": "https://example.com/image.png"}]
-        mock_message = MagicMock()
-        mock_message.content = mock_content
+        mock_response = make_response(content=[{"image": "https://example.com/image.png"}])
         
-        mock_choice = MagicMock()
-        mock_choice.message = mock_message
-        
-        mock_output = MagicMock()
-        mock_output.choices = [mock_choice]
+        mock_multimodal.return_value = mock_response
+        client = DashScopeClient()
+        client.api_key = "test_key"
         
-        mock_response.output = mock_output
+        urls = await client.generate_image(
+            model="qwen-image-max",
+            prompt="一只猫"
+        )
         
-        with patch('dashscope.MultiModalConversation.call', return_value=mock_response):
-            client = DashScopeClient()
-            client.api_key = "test_key"
-            
-            urls = await client.generate_image(
-                model="qwen-image-max",
-                prompt="一只猫"
-            )
-            
-            assert len(urls) == 1
-            assert "example.com" in urls[0]
-    
+        assert len(urls) == 1
+        assert "example.com" in urls[0]
+
     @pytest.mark.asyncio
-    async def test_generate_image_error(self):
+    async def test_generate_image_error(self, mock_multimodal):
         """测试图片生成失败"""
-        from app.services.model_client import DashScopeClient
-        
-        mock_response = MagicMock()
-        mock_response.status_code = 400
+        mock_response = make_response(status_code=400)
         mock_response.code = "InvalidParameter"
         mock_response.message = "参数错误"
         
-        with patch('dashscope.MultiModalConversation.call', return_value=mock_response):
-            client = DashScopeClient()
-            client.api_key = "test_key"
-            
-            with pytest.raises(Exception, match="图片生成失败"):
-                await client.generate_image(
-                    model="qwen-image-max",
-                    prompt="测试"
-                )
+        mock_multimodal.return_value = mock_response
+        client = DashScopeClient()
+        client.api_key = "test_key"
+        
+        with pytest.raises(Exception, match="图片生成失败"):
+            await client.generate_image(
+                model="qwen-image-max",
+                prompt="测试"
+            )
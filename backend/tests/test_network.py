@@ -3,156 +3,153 @@
 
 测试与外部服务的连接性。
 运行: pytest tests/test_network.py -v
+跳过访问外部网络的测试: pytest tests/test_network.py -m "not network"
+冒烟模式（复用上次的模型回复）: LLM_CACHE=1 pytest tests/test_network.py -v
+路由检查打到运行中的服务: PYTEST_LIVE=1 [PYTEST_LIVE_URL=http://127.0.0.1:8001] pytest tests/test_network.py -v
 """
+import os
+import asyncio
+import httpx
 import pytest
+import pytest_asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
 from app.config import settings
 
 
+# PYTEST_LIVE=1 时路由检查改走真实服务；默认仍用进程内 ASGI 客户端
+LIVE_ENV = "PYTEST_LIVE"
+LIVE_BASE_URL = os.environ.get("PYTEST_LIVE_URL", "http://127.0.0.1:8001")
+
+
+@pytest_asyncio.fixture
+async def route_client(client: httpx.AsyncClient):
+    """路由检查用的客户端：实机模式下开启 HTTP/2（https 时多个请求复用一条连接）"""
+    if os.environ.get(LIVE_ENV) != "1":
+        yield client
+        return
+    async with httpx.AsyncClient(http2=True, base_url=LIVE_BASE_URL, timeout=10.0) as ac:
+        yield ac
+
+
 class TestNetworkConnectivity:
     """测试网络连接"""
     
+    pytestmark = pytest.mark.network
+    
     @pytest.mark.asyncio
-    async def test_dashscope_api_reachable(self):
+    async def test_dashscope_api_reachable(self, http_client: httpx.AsyncClient):
         """测试 DashScope API 端点可达"""
-        import httpx
-        
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            try:
-                # 简单测试端点是否响应
-                response = await client.get(
-                    f"{settings.dashscope_base_url}/models",
-                    headers={"Authorization": f"Bearer {settings.dashscope_api_key}"}
-                )
-                # 任何响应都说明端点可达
-                assert response.status_code in [200, 401, 403, 404, 405]
-                print(f"\n✓ DashScope API 端点可达 (HTTP {response.status_code})")
-            except httpx.ConnectError:
-                pytest.fail("无法连接到 DashScope API")
-            except httpx.TimeoutException:
-                pytest.fail("连接 DashScope API 超时")
+        try:
+            # 简单测试端点是否响应
+            response = await http_client.get(
+                f"{settings.dashscope_base_url}/models",
+                headers={"Authorization": f"Bearer {settings.dashscope_api_key}"}
+            )
+            # 任何响应都说明端点可达
+            assert response.status_code in [200, 401, 403, 404, 405]
+            print(f"\n✓ DashScope API 端点可达 (HTTP {response.status_code})")
+        except httpx.ConnectError:
+            pytest.fail("无法连接到 DashScope API")
+        except httpx.TimeoutException:
+            pytest.fail("连接 DashScope API 超时")
 
 
 class TestModelAvailability:
     """测试模型可用性（需要有效 API Key）"""
     
+    # 收集阶段整类判断一次：没有 Key 时全部跳过
+    pytestmark = [
+        pytest.mark.skipif(not settings.dashscope_api_key, reason="DASHSCOPE_API_KEY 未设置"),
+        pytest.mark.network,
+    ]
+    
     @pytest.mark.asyncio
-    @pytest.mark.skipif(not settings.dashscope_api_key, reason="DASHSCOPE_API_KEY 未设置")
-    async def test_controller_model(self):
-        """测试中控模型可用"""
+    async def test_all_models_available(self):
+        """测试中控 / 撰写 / 图文模型可用（三个探测互不依赖，并发执行）"""
         from app.services.model_client import model_client
         
-        try:
-            reasoning, content = await model_client.call_with_thinking(
-                model=settings.model_controller,
-                messages=[{"role": "user", "content": "说'测试成功'"}],
-                max_tokens=50
-            )
-            
-            assert content is not None
+        messages = [{"role": "user", "content": "说'测试成功'"}]
+        controller_result, writer_result, diagram_result = await asyncio.gather(
+            model_client.call_with_thinking(
+                model=settings.model_controller, messages=messages, max_tokens=50
+            ),
+            model_client.call(model=settings.model_writer, messages=messages, max_tokens=50),
+            model_client.call(model=settings.model_diagram, messages=messages, max_tokens=50),
+            return_exceptions=True,
+        )
+        
+        failures = []
+        
+        if isinstance(controller_result, BaseException):
+            failures.append(f"中控模型调用失败: {controller_result}")
+        elif controller_result[1] is None:
+            failures.append("中控模型返回空回复")
+        else:
+            reasoning, content = controller_result
             print(f"\n✓ 中控模型 ({settings.model_controller}) 可用")
             print(f"  思考: {reasoning[:50]}..." if reasoning else "  思考: 无")
             print(f"  回复: {content[:50]}...")
-        except Exception as e:
-            pytest.fail(f"中控模型调用失败: {e}")
-    
-    @pytest.mark.asyncio
-    @pytest.mark.skipif(not settings.dashscope_api_key, reason="DASHSCOPE_API_KEY 未设置")
-    async def test_writer_model(self):
-        """测试撰写模型可用"""
-        from app.services.model_client import model_client
         
-        try:
-            content = await model_client.call(
-                model=settings.model_writer,
-                messages=[{"role": "user", "content": "说'测试成功'"}],
-                max_tokens=50
-            )
-            
-            assert content is not None
-            print(f"\n✓ 撰写模型 ({settings.model_writer}) 可用")
-            print(f"  回复: {content[:50]}...")
-        except Exception as e:
-            pytest.fail(f"撰写模型调用失败: {e}")
-    
-    @pytest.mark.asyncio
-    @pytest.mark.skipif(not settings.dashscope_api_key, reason="DASHSCOPE_API_KEY 未设置")
-    async def test_diagram_model(self):
-        """测试图文模型可用"""
-        from app.services.model_client import model_client
+        for label, model, result in (
+            ("撰写模型", settings.model_writer, writer_result),
+            ("图文模型", settings.model_diagram, diagram_result),
+        ):
+            if isinstance(result, BaseException):
+                failures.append(f"{label}调用失败: {result}")
+            elif result is None:
+                failures.append(f"{label}返回空回复")
+            else:
+                print(f"\n✓ {label} ({model}) 可用")
+                print(f"  回复: {result[:50]}...")
         
-        try:
-            content = await model_client.call(
-                model=settings.model_diagram,
-                messages=[{"role": "user", "content": "说'测试成功'"}],
-                max_tokens=50
-            )
-            
-            assert content is not None
-            print(f"\n✓ 图文模型 ({settings.model_diagram}) 可用")
-            print(f"  回复: {content[:50]}...")
-        except Exception as e:
-            pytest.fail(f"图文模型调用失败: {e}")
+        # 所有模型都报告完再统一判定
+        assert not failures, "; ".join(failures)
 
 
 class TestDatabaseConnectivity:
     """测试数据库连接"""
     
     @pytest.mark.asyncio
-    async def test_database_connection(self):
+    async def test_database_connection(self, db_engine: AsyncEngine):
         """测试数据库连接"""
-        from sqlalchemy.ext.asyncio import create_async_engine
-        from sqlalchemy import text
-        
-        engine = create_async_engine(settings.database_url, echo=False)
-        
         try:
-            async with engine.begin() as conn:
+            async with db_engine.connect() as conn:
                 result = await conn.execute(text("SELECT 1"))
                 assert result.scalar() == 1
                 print("\n✓ 数据库连接成功")
         except Exception as e:
             pytest.fail(f"数据库连接失败: {e}")
-        finally:
-            await engine.dispose()
 
 
 class TestServiceHealth:
     """测试服务健康状态"""
     
     @pytest.mark.asyncio
-    async def test_fastapi_startup(self):
+    async def test_fastapi_startup(self, client: httpx.AsyncClient):
         """测试 FastAPI 应用启动"""
-        from httpx import AsyncClient, ASGITransport
-        from app.main import app
-        
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            # 根路径应该有响应
-            response = await client.get("/")
-            assert response.status_code in [200, 404]
-            print("\n✓ FastAPI 应用启动成功")
+        # 根路径应该有响应
+        response = await client.get("/")
+        assert response.status_code in [200, 404]
+        print("\n✓ FastAPI 应用启动成功")
     
     @pytest.mark.asyncio
-    async def test_api_routes_registered(self):
-        """测试 API 路由已注册"""
-        from httpx import AsyncClient, ASGITransport
-        from app.main import app
+    async def test_api_routes_registered(self, route_client: httpx.AsyncClient):
+        """测试 API 路由已注册（各路由互不依赖，并发请求）"""
+        # 测试各主要路由
+        routes = [
+            ("/api/auth/login", "POST"),
+            ("/api/docs/my", "GET"),
+        ]
+        
+        responses = await asyncio.gather(*[
+            route_client.request(method, route, json={} if method == "POST" else None)
+            for route, method in routes
+        ])
+        
+        for (route, _), response in zip(routes, responses):
+            # 不应该是 500 服务器错误
+            assert response.status_code != 500, f"路由 {route} 返回服务器错误"
         
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as client:
-            # 测试各主要路由
-            routes = [
-                ("/api/auth/login", "POST"),
-                ("/api/docs/my", "GET"),
-            ]
-            
-            for route, method in routes:
-                if method == "GET":
-                    response = await client.get(route)
-                else:
-                    response = await client.post(route, json={})
-                
-                # 不应该是 500 服务器错误
-                assert response.status_code != 500, f"路由 {route} 返回服务器错误"
-            
-            print("\n✓ API 路由已正确注册")
+        print("\n✓ API 路由已正确注册")
@@ -2,37 +2,17 @@
 LangGraph 节点单元测试
 """
 import pytest
-from unittest.mock import AsyncMock, patch, MagicMock
 
+from tests._mocks import make_response
 
-class MockResponse:
-    """模拟 DashScope SDK 响应"""
-    def __init__(self, status_code=200, content="", reasoning_content=""):
-        self.status_code = status_code
-        self.code = "" if status_code == 200 else "Error"
-        self.message = "" if status_code == 200 else "错误"
-        
-        mock_message = MagicMock()
-        mock_message.content = content
-        mock_message.reasoning_content = reasoning_content
-        
-        mock_choice = MagicMock()
-        mock_choice.message = mock_message
-        
-        mock_output = MagicMock()
-        mock_output.choices = [mock_choice]
-        
-        self.output = mock_output
 
+def _fenced(body: str) -> str:
+    """模型常见输出：```json 代码块包裹的 JSON"""
+    return "```json\n" + body + "\n```"
 
-class TestControllerNode:
-    """测试中控节点"""
-    
-    @pytest.mark.asyncio
-    async def test_controller_basic_input(self):
-        """测试中控节点基本输入"""
-        mock_content = '''```json
-{
+
+# 模型返回的 JSON 载荷（模块级常量，测试中只做解析）
+CONTROLLER_FIXTURE_JSON = '''{
     "doc_variables_patch": {
         "doc_type": "project_proposal"
     },
@@ -43,57 +23,57 @@ class TestControllerNode:
     },
     "reply": "我理解您需要写一份项目提案。请问目标受众是谁？",
     "ready_to_write": false
-}
-```'''
-        mock_response = MockResponse(
-            content=mock_content,
-            reasoning_content="用户想写项目提案，需要收集更多信息..."
-        )
-        
-        with patch('dashscope.Generation.call', return_value=mock_response):
-            from app.nodes.controller import run, _parse_controller_response
-            
-            state = {
-                "doc_variables": {},
-                "chat_history": [{"role": "user", "content": "帮我写一份项目提案"}],
-                "attachments": [],
-                "node_runs": [],
-            }
-            
-            result = await run(state)
-            
-            assert result["node_status"] == "success"
-            assert "doc_type" in result["doc_variables"]
-            assert result["ready_to_write"] == False
-    
-    def test_parse_controller_response_valid_json(self):
-        """测试解析有效 JSON 响应"""
-        from app.nodes.controller import _parse_controller_response
-        
-        response = '''```json
-{
-    "doc_variables_patch": {"key": "value"},
-    "validation_report": {"missing_fields": []},
-    "reply": "好的",
-    "ready_to_write": true
-}
-```'''
-        
-        result = _parse_controller_response(response)
-        
-        assert result["doc_variables_patch"] == {"key": "value"}
-        assert result["ready_to_write"] == True
+}'''
+VALID_CONTROLLER_RESPONSE = _fenced(CONTROLLER_FIXTURE_JSON)
+
+WRITER_FIXTURE_JSON = '''{
+    "draft_md": "# 项目提案\\n\\n这是简介。\\n\\n{{MERMAID:流程图}}",
+    "mermaid_placeholders": [
+        {"id": "mermaid_1", "description": "流程图"}
+    ],
+    "html_placeholders": []
+}'''
+WRITER_RESPONSE = _fenced(WRITER_FIXTURE_JSON)
+
+DIAGRAM_FIXTURE_JSON = '''{
+    "code": "graph TD\\n    A[开始] --> B[结束]",
+    "type": "flowchart"
+}'''
+DIAGRAM_RESPONSE = _fenced(DIAGRAM_FIXTURE_JSON)
+
+
+@pytest.fixture(autouse=True)
+def mock_dashscope(monkeypatch, request):
+    """替换 Generation.call：返回 @pytest.mark.dashscope_resp(...) 指定的响应，未标记时返回空回复"""
+    marker = request.node.get_closest_marker("dashscope_resp")
+    response = marker.args[0] if marker else make_response()
+    monkeypatch.setattr("dashscope.Generation.call", lambda *args, **kwargs: response)
+    return response
+
+
+class TestControllerNode:
+    """测试中控节点"""
     
-    def test_parse_controller_response_invalid_json(self):
-        """测试解析无效 JSON 响应"""
-        from app.nodes.controller import _parse_controller_response
+    @pytest.mark.asyncio
+    @pytest.mark.dashscope_resp(make_response(
+        content=VALID_CONTROLLER_RESPONSE,
+        reasoning_content="用户想写项目提案，需要收集更多信息..."
+    ))
+    async def test_controller_basic_input(self):
+        """测试中控节点基本输入"""
+        from app.nodes.controller import run
         
-        response = "这只是普通文本，不是 JSON"
+        state = {
+            "doc_variables": {},
+            "chat_history": [{"role": "user", "content": "帮我写一份项目提案"}],
+            "attachments": [],
+            "node_runs": [],
+        }
         
-        result = _parse_controller_response(response)
+        result = await run(state)
         
-        # 应该优雅降级
-        assert result["reply"] == response
+        assert result["node_status"] == "success"
+        assert "doc_type" in result["doc_variables"]
         assert result["ready_to_write"] == False
 
 
@@ -101,36 +81,25 @@ class TestWriterNode:
     """测试撰写节点"""
     
     @pytest.mark.asyncio
+    @pytest.mark.dashscope_resp(make_response(content=WRITER_RESPONSE))
     async def test_writer_generates_draft(self):
         """测试撰写节点生成草稿"""
-        mock_content = '''```json
-{
-    "draft_md": "# 项目提案\\n\\n这是简介。\\n\\n{{MERMAID:流程图}}",
-    "mermaid_placeholders": [
-        {"id": "mermaid_1", "description": "流程图"}
-    ],
-    "html_placeholders": []
-}
-```'''
-        mock_response = MockResponse(content=mock_content)
+        from app.nodes.writer import run
+        
+        state = {
+            "doc_variables": {
+                "doc_type": "project_proposal",
+                "outline": ["简介", "目标"]
+            },
+            "attachments": [],
+            "node_runs": [],
+        }
+        
+        result = await run(state)
         
-        with patch('dashscope.Generation.call', return_value=mock_response):
-            from app.nodes.writer import run
-            
-            state = {
-                "doc_variables": {
-                    "doc_type": "project_proposal",
-                    "outline": ["简介", "目标"]
-                },
-                "attachments": [],
-                "node_runs": [],
-            }
-            
-            result = await run(state)
-            
-            assert result["node_status"] == "success"
-            assert "draft_md" in result
-            assert len(result["mermaid_placeholders"]) == 1
+        assert result["node_status"] == "success"
+        assert "draft_md" in result
+        assert len(result["mermaid_placeholders"]) == 1
     
     @pytest.mark.asyncio
     async def test_writer_insufficient_info(self):
@@ -153,32 +122,24 @@ class TestDiagramNode:
     """测试图表节点"""
     
     @pytest.mark.asyncio
+    @pytest.mark.dashscope_resp(make_response(content=DIAGRAM_RESPONSE))
     async def test_diagram_generates_mermaid(self):
         """测试生成 Mermaid 代码"""
-        mock_content = '''```json
-{
-    "code": "graph TD\\n    A[开始] --> B[结束]",
-    "type": "flowchart"
-}
-```'''
-        mock_response = MockResponse(content=mock_content)
+        from app.nodes.diagram import run
+        
+        state = {
+            "mermaid_placeholders": [
+                {"id": "mermaid_1", "description": "简单流程图"}
+            ],
+            "html_placeholders": [],
+            "doc_variables": {},
+            "node_runs": [],
+        }
         
-        with patch('dashscope.Generation.call', return_value=mock_response):
-            from app.nodes.diagram import run
-            
-            state = {
-                "mermaid_placeholders": [
-                    {"id": "mermaid_1", "description": "简单流程图"}
-                ],
-                "html_placeholders": [],
-                "doc_variables": {},
-                "node_runs": [],
-            }
-            
-            result = await run(state)
-            
-            assert result["node_status"] == "success"
-            assert "mermaid_1" in result["mermaid_codes"]
+        result = await run(state)
+        
+        assert result["node_status"] == "success"
+        assert "mermaid_1" in result["mermaid_codes"]
     
     @pytest.mark.asyncio
     async def test_diagram_no_placeholders(self):
@@ -273,25 +234,23 @@ class TestAttachmentNode:
     """测试附件分析节点"""
     
     @pytest.mark.asyncio
+    @pytest.mark.dashscope_resp(make_response(content="这是一份项目计划书，主要包含..."))
     async def test_attachment_analyze(self):
         """测试附件分析"""
-        mock_response = MockResponse(content="这是一份项目计划书，主要包含...")
+        from app.nodes.attachment import run
+        
+        state = {
+            "attachments": [
+                {"id": "att_1", "file_id": "file_123", "filename": "plan.pdf"}
+            ],
+            "doc_variables": {},
+            "node_runs": [],
+        }
         
-        with patch('dashscope.Generation.call', return_value=mock_response):
-            from app.nodes.attachment import run
-            
-            state = {
-                "attachments": [
-                    {"id": "att_1", "file_id": "file_123", "filename": "plan.pdf"}
-                ],
-                "doc_variables": {},
-                "node_runs": [],
-            }
-            
-            result = await run(state)
-            
-            assert result["node_status"] == "success"
-            assert "attachment_analysis" in result
+        result = await run(state)
+        
+        assert result["node_status"] == "success"
+        assert "attachment_analysis" in result
     
     @pytest.mark.asyncio
     async def test_attachment_no_files(self):
@@ -1,12 +1,14 @@
 """
 Unit tests for utility functions
 """
-import os
+import io
+import shutil
 import tempfile
 import pytest
 from datetime import timedelta
+from pathlib import Path
 
-from app.utils.auth import create_access_token, decode_access_token
+from app.utils.auth import create_access_token, decode_access_token, hash_password, verify_password
 from app.utils.storage import save_file, get_file_url, ensure_dir
 from app.config import settings
 
@@ -14,6 +16,18 @@ from app.config import settings
 class TestAuthUtils:
     """Test authentication utilities"""
     
+    def test_hash_and_verify_password(self):
+        """Test bcrypt password hashing round trip"""
+        hashed = hash_password("testpass123")
+        
+        assert hashed.startswith("$2")
+        assert verify_password("testpass123", hashed)
+        assert not verify_password("wrongpass", hashed)
+    
+    def test_verify_password_invalid_hash(self):
+        """Test verifying against a malformed hash"""
+        assert verify_password("testpass123", "not-a-bcrypt-hash") is False
+    
     def test_create_access_token(self):
         """Test creating JWT token"""
         token = create_access_token(
@@ -44,6 +58,23 @@ class TestAuthUtils:
         
         assert payload is None
     
+    def test_decode_access_token_cached(self):
+        """Test repeated decoding of the same token is served from cache"""
+        from unittest.mock import patch
+        import app.utils.auth as auth_module
+        
+        token = create_access_token(
+            data={"sub": "cached_user"},
+            expires_delta=timedelta(hours=1)
+        )
+        
+        first = decode_access_token(token)
+        with patch.object(auth_module.jwt, "decode", side_effect=AssertionError("should hit cache")):
+            second = decode_access_token(token)
+        
+        assert first == second
+        assert second.get("sub") == "cached_user"
+    
     def test_token_expiration(self):
         """Test token with very short expiration"""
         token = create_access_token(
@@ -57,78 +88,99 @@ class TestAuthUtils:
         assert payload is None
 
 
+class AsyncReader:
+    """Object with an async read(size), like UploadFile"""
+
+    def __init__(self, data: bytes):
+        self._buf = io.BytesIO(data)
+
+    async def read(self, size: int = -1) -> bytes:
+        return self._buf.read(size)
+
+
+# Larger than CHUNK_SIZE so the streamed case writes several chunks
+STREAM_CONTENT = b"x" * (3 * 1024 * 1024 + 7)
+
+
+@pytest.fixture
+def storage_root(tmp_path, monkeypatch):
+    """Point settings.storage_path at a per-test temp dir (restored by monkeypatch)"""
+    monkeypatch.setattr(settings, "storage_path", str(tmp_path))
+    yield tmp_path
+
+
 class TestStorageUtils:
     """Test storage utilities"""
     
     @pytest.mark.asyncio
-    async def test_save_file(self, tmp_path):
-        """Test saving file"""
-        # Temporarily change storage path
-        original_storage = settings.storage_path
-        settings.storage_path = str(tmp_path)
-        
-        try:
-            content = b"Test file content"
-            filepath = await save_file(content, "test.txt", "test_subdir")
-            
-            assert os.path.exists(filepath)
-            with open(filepath, "rb") as f:
-                assert f.read() == content
-        finally:
-            settings.storage_path = original_storage
+    @pytest.mark.parametrize("make_content, expected, filename", [
+        (lambda: b"Test file content", b"Test file content", "test.txt"),
+        (lambda: AsyncReader(STREAM_CONTENT), STREAM_CONTENT, "big.bin"),
+    ], ids=["bytes", "stream"])
+    async def test_save_file(self, storage_root, make_content, expected, filename):
+        """Test saving file from bytes and from an object with async read() in chunks"""
+        filepath = await save_file(make_content(), filename, "test_subdir")
+        
+        assert Path(filepath).read_bytes() == expected
     
     @pytest.mark.asyncio
-    async def test_save_file_unique_names(self, tmp_path):
+    async def test_save_file_unique_names(self, storage_root):
         """Test that saved files get unique names"""
-        original_storage = settings.storage_path
-        settings.storage_path = str(tmp_path)
-        
-        try:
-            content1 = b"Content 1"
-            content2 = b"Content 2"
-            
-            path1 = await save_file(content1, "same.txt", "test")
-            path2 = await save_file(content2, "same.txt", "test")
-            
-            # Should be different paths
-            assert path1 != path2
-            assert os.path.exists(path1)
-            assert os.path.exists(path2)
-        finally:
-            settings.storage_path = original_storage
+        content1 = b"Content 1"
+        content2 = b"Content 2"
+        
+        path1 = await save_file(content1, "same.txt", "test")
+        path2 = await save_file(content2, "same.txt", "test")
+        
+        # Should be different paths
+        assert path1 != path2
+        assert Path(path1).is_file()
+        assert Path(path2).is_file()
     
-    def test_get_file_url(self, tmp_path):
+    @pytest.mark.asyncio
+    async def test_save_file_recreates_deleted_dir(self, storage_root):
+        """Test saving again after the (already ensured) subdir was removed"""
+        await save_file(b"first", "a.txt", "wiped")
+        shutil.rmtree(storage_root / "wiped")
+        
+        filepath = await save_file(b"second", "b.txt", "wiped")
+        
+        assert Path(filepath).read_bytes() == b"second"
+    
+    def test_get_file_url(self, storage_root):
         """Test getting file URL"""
-        original_storage = settings.storage_path
-        settings.storage_path = str(tmp_path)
-        
-        try:
-            filepath = os.path.join(str(tmp_path), "attachments", "test.txt")
-            url = get_file_url(filepath)
-            
-            assert url.startswith("/storage/")
-            assert "attachments" in url
-        finally:
-            settings.storage_path = original_storage
+        filepath = str(storage_root / "attachments" / "test.txt")
+        url = get_file_url(filepath)
+        
+        assert url.startswith("/storage/")
+        assert "attachments" in url
+    
+    @pytest.mark.asyncio
+    async def test_save_file_url_round_trip_relative_path(self, tmp_path, monkeypatch):
+        """Test save_file -> get_file_url with the default-style relative storage_path"""
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(settings, "storage_path", "./storage")
+        
+        filepath = await save_file(b"content", "test.txt", "attachments")
+        url = get_file_url(filepath)
+        
+        assert url == "/storage/attachments/" + Path(filepath).name
     
     def test_ensure_dir(self, tmp_path):
         """Test ensuring directory exists"""
-        new_dir = os.path.join(str(tmp_path), "new", "nested", "dir")
+        new_dir = tmp_path / "new" / "nested" / "dir"
         
-        assert not os.path.exists(new_dir)
+        assert not new_dir.exists()
         
-        ensure_dir(new_dir)
+        ensure_dir(str(new_dir))
         
-        assert os.path.exists(new_dir)
-        assert os.path.isdir(new_dir)
+        assert new_dir.is_dir()
     
     def test_ensure_dir_existing(self, tmp_path):
         """Test ensuring existing directory (should not fail)"""
-        existing_dir = str(tmp_path)
-        
         # Should not raise
-        ensure_dir(existing_dir)
+        ensure_dir(tmp_path)
         
-        assert os.path.exists(existing_dir)
+        assert tmp_path.is_dir()
 
 
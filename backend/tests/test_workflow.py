@@ -1,21 +1,44 @@
 """
 Workflow API tests
 """
+import asyncio
 import pytest
+import pytest_asyncio
+from fastapi import HTTPException
 from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.user import User
+from app.routers.workflow import get_workflow_run
+
+# One document per test; each test starts its own run on its document
+WORKFLOW_DOC_TITLES = ("Workflow Test", "Chat Test", "Status Test")
+
+
+@pytest_asyncio.fixture(scope="module")
+async def workflow_docs(auth_client: tuple[AsyncClient, dict]) -> dict[str, str]:
+    """Create the per-test documents concurrently, once per module (title -> doc_id)"""
+    client, _ = auth_client
+    responses = await asyncio.gather(*[
+        client.post("/api/docs", json={"title": title}) for title in WORKFLOW_DOC_TITLES
+    ])
+    for response in responses:
+        assert response.status_code == 200
+    return {title: r.json()["doc_id"] for title, r in zip(WORKFLOW_DOC_TITLES, responses)}
 
 
 class TestWorkflowAPI:
     """Test workflow endpoints"""
     
     @pytest.mark.asyncio
-    async def test_start_workflow(self, auth_client: tuple[AsyncClient, dict]):
+    async def test_start_workflow(
+        self, auth_client: tuple[AsyncClient, dict], workflow_docs: dict[str, str]
+    ):
         """Test starting a workflow"""
         client, _ = auth_client
         
-        # Create a document first
-        doc_response = await client.post("/api/docs", json={"title": "Workflow Test"})
-        doc_id = doc_response.json()["doc_id"]
+        # Document pre-created by workflow_docs
+        doc_id = workflow_docs["Workflow Test"]
         
         # Start workflow
         response = await client.post(f"/api/workflow/docs/{doc_id}/run", json={
@@ -28,13 +51,14 @@ class TestWorkflowAPI:
         assert data["status"] == "started"
     
     @pytest.mark.asyncio
-    async def test_send_chat_message(self, auth_client: tuple[AsyncClient, dict]):
+    async def test_send_chat_message(
+        self, auth_client: tuple[AsyncClient, dict], workflow_docs: dict[str, str]
+    ):
         """Test sending chat message"""
         client, _ = auth_client
         
-        # Create a document
-        doc_response = await client.post("/api/docs", json={"title": "Chat Test"})
-        doc_id = doc_response.json()["doc_id"]
+        # Document pre-created by workflow_docs
+        doc_id = workflow_docs["Chat Test"]
         
         # Send chat message
         response = await client.post(f"/api/workflow/docs/{doc_id}/chat", json={
@@ -46,14 +70,14 @@ class TestWorkflowAPI:
         assert "run_id" in data
     
     @pytest.mark.asyncio
-    async def test_get_workflow_status(self, auth_client: tuple[AsyncClient, dict]):
+    async def test_get_workflow_status(
+        self, auth_client: tuple[AsyncClient, dict], workflow_docs: dict[str, str]
+    ):
         """Test getting workflow status"""
         client, _ = auth_client
         
-        # Create and start workflow
-        doc_response = await client.post("/api/docs", json={"title": "Status Test"})
-        doc_id = doc_response.json()["doc_id"]
-        
+        # Start workflow on the pre-created document
+        doc_id = workflow_docs["Status Test"]
         run_response = await client.post(f"/api/workflow/docs/{doc_id}/run", json={
             "user_message": "Test message"
         })
@@ -79,12 +103,11 @@ class TestWorkflowAPI:
         assert response.status_code == 404
     
     @pytest.mark.asyncio
-    async def test_get_nonexistent_workflow(self, auth_client: tuple[AsyncClient, dict]):
-        """Test getting nonexistent workflow"""
-        client, _ = auth_client
+    async def test_get_nonexistent_workflow(self, test_db: AsyncSession, fake_user: User):
+        """Test getting nonexistent workflow (handler called directly)"""
+        with pytest.raises(HTTPException) as exc:
+            await get_workflow_run("nonexistent-run-id", user=fake_user, db=test_db)
         
-        response = await client.get("/api/workflow/runs/nonexistent-run-id")
-        
-        assert response.status_code == 404
+        assert exc.value.status_code == 404
 
 